@@ -0,0 +1,66 @@
+﻿"""
+Аутентификация по токену с кэшем token -> user_id.
+
+Стандартная TokenAuthentication читает Token вместе с User на каждом
+запросе. Здесь из отдельного алиаса кэша (AUTH_TOKEN_CACHE_ALIAS)
+берётся только id пользователя проверенного токена и updated_at
+пользователя на момент проверки, а сам пользователь читается из БД по
+первичному ключу. Поэтому представления сохраняют свежий объект, а не
+копию из кэша, в которой устарели счётчики.
+
+Запись действительна, пока updated_at в БД совпадает с запомненным:
+смена пароля, деактивация и правка профиля сохраняют пользователя, а
+выход (удаление токена) обновляет updated_at в signals.py. Так отзыв
+токена видят все процессы, даже с LocMemCache в каждом из них.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from users.models import User
+
+TOKEN_KEY = "token:{}"
+
+
+def get_cache():
+    return caches[settings.AUTH_TOKEN_CACHE_ALIAS]
+
+
+def _cache_key(key):
+    # В общем кэше ключи видны всем, поэтому сам токен в них не попадает.
+    return TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def invalidate(keys):
+    """Удаляет записи из кэша текущего процесса сразу."""
+    cache_keys = [_cache_key(key) for key in keys]
+    if cache_keys:
+        get_cache().delete_many(cache_keys)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, которая при попадании в кэш читает только
+    пользователя, без таблицы токенов.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_cache()
+        cache_key = _cache_key(key)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            user_id, updated_at = cached
+            user = User.objects.filter(pk=user_id).first()
+            if user is not None and user.updated_at == updated_at:
+                if not user.is_active:
+                    raise AuthenticationFailed(
+                        _("User inactive or deleted.")
+                    )
+                return user, Token(key=key, user=user)
+        user, token = super().authenticate_credentials(key)
+        cache.set(cache_key, (user.pk, user.updated_at))
+        return user, token
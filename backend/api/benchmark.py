@@ -0,0 +1,362 @@
+﻿"""
+Нагрузочный прогон API: задержки, пропускная способность и число
+SQL-запросов на каждый маршрут.
+
+Запросы идут через тестовый клиент Django в том же процессе (число
+запросов к БД считается точно) или по HTTP к запущенному серверу
+(--base-url). Данные берутся из текущей БД - для заметных цифр её
+стоит заполнить командой generate_dataset. Записывающие сценарии
+(избранное, корзина, подписка) идут парами POST/DELETE и оставляют
+данные как были.
+"""
+import http.client
+import math
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from django.db import connection
+from django.db.models import Count
+from recipes import shortcodes
+from recipes.models import Follow, Ingredient, Recipe, ShoppingCart
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+from .clicks import ClickBuffer
+from .views import ShortLinkRedirectView
+
+PERCENTILES = (50, 95, 99)
+# Сколько разных рецептов перебирают сценарии деталей и ссылок.
+RECIPES = 100
+
+
+@dataclass
+class Scenario:
+    name: str
+    # Один шаг или несколько (запрос и обратный ему), каждый шаг -
+    # (метод, путь).
+    steps: list
+    auth: bool = False
+
+
+@dataclass
+class Measurement:
+    latencies: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    statuses: set = field(default_factory=set)
+
+
+@dataclass
+class Context:
+    """Объекты из БД, на которых гоняются сценарии."""
+
+    user: User
+    # Автор с наибольшим числом рецептов - для фильтра по автору.
+    author: User
+    # Автор и рецепт, с которыми у user ещё нет связей, - для пар
+    # POST/DELETE, чтобы они возвращали данные в исходное состояние.
+    free_author: User
+    free_recipe_id: int
+    recipe_ids: list
+    ingredient_id: int
+    ingredient_prefix: str
+
+    @classmethod
+    def load(cls):
+        # Активный пользователь: больше всего подписок среди тех, у кого
+        # не пуста корзина, - чтобы лента и список покупок были не пустыми.
+        busiest = Follow.objects.filter(
+            user__in=ShoppingCart.objects.values("author")
+        ).values("user").annotate(total=Count("pk")).order_by(
+            "-total"
+        ).first()
+        user = (
+            User.objects.get(pk=busiest["user"]) if busiest
+            else User.objects.order_by("pk").first()
+        )
+        if user is None:
+            return None
+        others = User.objects.exclude(pk=user.pk).order_by(
+            "-recipes_count", "pk"
+        )
+        author = others.first()
+        free_author = others.exclude(
+            pk__in=Follow.objects.filter(user=user).values("author")
+        ).first()
+        free_recipe_id = Recipe.objects.exclude(
+            favorite__author=user
+        ).exclude(shopping_cart__author=user).order_by("pk").values_list(
+            "pk", flat=True
+        ).first()
+        # Популярные рецепты: на них приходится основная часть просмотров.
+        recipe_ids = list(Recipe.objects.order_by(
+            "-favorites_count", "pk"
+        ).values_list("pk", flat=True)[:RECIPES])
+        ingredient = Ingredient.objects.order_by("pk").first()
+        if None in (author, free_author, free_recipe_id, ingredient):
+            return None
+        return cls(
+            user=user,
+            author=author,
+            free_author=free_author,
+            free_recipe_id=free_recipe_id,
+            recipe_ids=recipe_ids,
+            ingredient_id=ingredient.pk,
+            ingredient_prefix=ingredient.name[:2],
+        )
+
+
+def scenarios(ctx):
+    """Сценарии по всем маршрутам api/urls.py."""
+    recipe = ctx.free_recipe_id
+
+    def each_recipe(template):
+        return [("get", template.format(pk)) for pk in ctx.recipe_ids]
+
+    return [
+        Scenario("recipes list", [("get", "/api/recipes/")]),
+        Scenario("recipes list page 20", [("get", "/api/recipes/?page=20")]),
+        Scenario(
+            "recipes list cursor",
+            [("get", "/api/recipes/?pagination=cursor&limit=10")],
+        ),
+        Scenario(
+            "recipes by author",
+            [("get", f"/api/recipes/?author={ctx.author.pk}")],
+        ),
+        Scenario(
+            "recipes is_favorited",
+            [("get", "/api/recipes/?is_favorited=1")], auth=True,
+        ),
+        Scenario(
+            "recipes is_in_shopping_cart",
+            [("get", "/api/recipes/?is_in_shopping_cart=1")], auth=True,
+        ),
+        Scenario("recipes list auth", [("get", "/api/recipes/")], auth=True),
+        Scenario("recipe detail", each_recipe("/api/recipes/{}/")),
+        Scenario(
+            "recipe detail auth", each_recipe("/api/recipes/{}/"), auth=True
+        ),
+        Scenario("recipe feed", [("get", "/api/recipes/feed/")], auth=True),
+        Scenario("recipe get-link", each_recipe("/api/recipes/{}/get-link/")),
+        Scenario(
+            "short-link redirect",
+            [
+                ("get", f"/api/s/{shortcodes.encode(pk)}/")
+                for pk in ctx.recipe_ids
+            ],
+        ),
+        Scenario(
+            "ingredients search",
+            [("get", f"/api/ingredients/?name={ctx.ingredient_prefix}")],
+        ),
+        Scenario("ingredients list", [("get", "/api/ingredients/")]),
+        Scenario(
+            "ingredient detail",
+            [("get", f"/api/ingredients/{ctx.ingredient_id}/")],
+        ),
+        Scenario("users list", [("get", "/api/users/")]),
+        Scenario("user detail", [("get", f"/api/users/{ctx.author.pk}/")]),
+        Scenario("users me", [("get", "/api/users/me/")], auth=True),
+        Scenario(
+            "subscriptions",
+            [("get", "/api/users/subscriptions/?recipes_limit=3")],
+            auth=True,
+        ),
+        Scenario(
+            "download shopping cart",
+            [("get", "/api/recipes/download_shopping_cart/?format=txt")],
+            auth=True,
+        ),
+        Scenario(
+            "favorite toggle",
+            [
+                ("post", f"/api/recipes/{recipe}/favorite/"),
+                ("delete", f"/api/recipes/{recipe}/favorite/"),
+            ],
+            auth=True,
+        ),
+        Scenario(
+            "shopping cart toggle",
+            [
+                ("post", f"/api/recipes/{recipe}/shopping_cart/"),
+                ("delete", f"/api/recipes/{recipe}/shopping_cart/"),
+            ],
+            auth=True,
+        ),
+        Scenario(
+            "subscribe toggle",
+            [
+                ("post", f"/api/users/{ctx.free_author.pk}/subscribe/"),
+                ("delete", f"/api/users/{ctx.free_author.pk}/subscribe/"),
+            ],
+            auth=True,
+        ),
+    ]
+
+
+class LocalDriver:
+    """Тестовый клиент Django: запросы в том же процессе."""
+
+    counts_queries = True
+
+    def __init__(self, token):
+        self.anonymous = APIClient(SERVER_NAME="localhost")
+        self.authorized = APIClient(SERVER_NAME="localhost")
+        self.authorized.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+
+    def __enter__(self):
+        # Переходы прогона не должны попасть в статистику ссылок.
+        self._click_buffer = ShortLinkRedirectView.click_buffer
+        ShortLinkRedirectView.click_buffer = ClickBuffer(autoflush=False)
+        return self
+
+    def __exit__(self, *exc_info):
+        ShortLinkRedirectView.click_buffer = self._click_buffer
+
+    def request(self, method, path, auth):
+        client = self.authorized if auth else self.anonymous
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            # Счётчик, а не connection.queries: тот ограничен 9000
+            # записей и на длинном прогоне перестаёт расти.
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            response = getattr(client, method)(path)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        return response.status_code, queries
+
+
+class HttpDriver:
+    """
+    HTTP к запущенному серверу (gunicorn, runserver). Соединение на
+    каждый запрос: на keep-alive ответы, отправленные несколькими
+    send(), ждут задержанного ACK (~40 мс) и искажают замеры. Число
+    SQL-запросов берётся из X-DB-Queries, если на сервере включён
+    REQUEST_TIMING.
+    """
+
+    counts_queries = False
+
+    def __init__(self, token, base_url):
+        url = urlsplit(base_url)
+        self.connection_class = (
+            http.client.HTTPSConnection if url.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.host = url.hostname
+        self.port = url.port
+        self.prefix = url.path.rstrip("/")
+        self.token = token
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def request(self, method, path, auth):
+        headers = {"Connection": "close"}
+        if auth:
+            headers["Authorization"] = f"Token {self.token}"
+        connection = self.connection_class(self.host, self.port)
+        try:
+            connection.request(
+                method.upper(), self.prefix + path, headers=headers
+            )
+            response = connection.getresponse()
+            response.read()
+        finally:
+            connection.close()
+        queries = response.getheader("X-DB-Queries")
+        return response.status, None if queries is None else int(queries)
+
+
+def percentile(values, percent):
+    """Процентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def run(driver, scenario, requests, warmup):
+    """Замеры по каждому шагу сценария: {"название METHOD": Measurement}."""
+    results = {}
+    steps = len(scenario.steps)
+    # Шаги-пары (POST/DELETE) идут по очереди, перебор путей - по кругу.
+    paired = any(method != "get" for method, _ in scenario.steps)
+    for number in range(warmup + requests):
+        batch = scenario.steps if paired else [
+            scenario.steps[number % steps]
+        ]
+        for method, path in batch:
+            started = time.perf_counter()
+            status, queries = driver.request(method, path, scenario.auth)
+            elapsed = time.perf_counter() - started
+            if number < warmup:
+                continue
+            name = (
+                f"{scenario.name} {method.upper()}" if paired
+                else scenario.name
+            )
+            measurement = results.setdefault(name, Measurement())
+            measurement.latencies.append(elapsed)
+            measurement.statuses.add(status)
+            if queries is not None:
+                measurement.queries.append(queries)
+    return results
+
+
+def summarize(measurement):
+    latencies = measurement.latencies
+    total = sum(latencies)
+    summary = {
+        f"p{percent}_ms": round(percentile(latencies, percent) * 1000, 3)
+        for percent in PERCENTILES
+    }
+    summary.update(
+        mean_ms=round(total / len(latencies) * 1000, 3),
+        rps=round(len(latencies) / total, 1) if total else None,
+        requests=len(latencies),
+        statuses=sorted(measurement.statuses),
+        queries=max(measurement.queries) if measurement.queries else None,
+    )
+    return summary
+
+
+def compare(baseline, current, threshold):
+    """
+    Регрессии относительно прошлого прогона: p95 вырос больше чем на
+    threshold процентов или стало больше SQL-запросов.
+    """
+    regressions = []
+    for name, result in current.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if before["p95_ms"] and (
+            result["p95_ms"] > before["p95_ms"] * (1 + threshold / 100)
+        ):
+            regressions.append(
+                f"{name}: p95 {before['p95_ms']} -> {result['p95_ms']} мс"
+            )
+        if (
+            before.get("queries") is not None
+            and result.get("queries") is not None
+            and result["queries"] > before["queries"]
+        ):
+            regressions.append(
+                f"{name}: SQL-запросов {before['queries']} -> "
+                f"{result['queries']}"
+            )
+    return regressions
+
+
+def token_for(user):
+    token, _ = Token.objects.get_or_create(user=user)
+    return token.key
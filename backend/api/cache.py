@@ -0,0 +1,86 @@
+﻿"""
+Общий кэш пользователь-независимой части сериализованных рецептов.
+
+В кэше лежат поля рецепта с ингредиентами и, отдельно, данные авторов.
+Флаги текущего пользователя (is_favorited, is_in_shopping_cart,
+is_subscribed) и абсолютные URL картинок подмешиваются при ответе.
+
+Ключ содержит updated_at объекта из БД: после любой правки запрос
+читает новую версию и не попадает в старую запись, в каком бы процессе
+она ни лежала, поэтому кэш может быть как локальным (LocMemCache), так и
+общим. Старые записи вытесняются по TIMEOUT и MAX_ENTRIES. Изменения,
+которые не сохраняют сам рецепт (правка ингредиента каталога), обновляют
+его updated_at через touch_recipes.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from recipes.models import Recipe
+
+# Увеличивается при изменении формата закэшированных данных.
+CACHE_VERSION = 3
+RECIPE_KEY = "recipe:{}:{}"
+AUTHOR_KEY = "author:{}:{}"
+
+
+class CacheStats:
+    """Счётчики попаданий и промахов кэша в рамках процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[settings.RECIPE_CACHE_ALIAS]
+
+
+def _key(key_template, instance):
+    return key_template.format(
+        instance.pk, int(instance.updated_at.timestamp() * 1_000_000)
+    )
+
+
+def get_many(key_template, instances):
+    """Возвращает {id: данные} для найденных в кэше объектов."""
+    keys = {
+        _key(key_template, instance): instance.pk for instance in instances
+    }
+    if not keys:
+        return {}
+    found = get_cache().get_many(keys, version=CACHE_VERSION)
+    stats.record(len(found), len(keys) - len(found))
+    return {keys[key]: value for key, value in found.items()}
+
+
+def store(key_template, instance, value):
+    get_cache().set(
+        _key(key_template, instance), value, version=CACHE_VERSION
+    )
+
+
+def touch_recipes(recipe_ids):
+    """
+    Новый updated_at рецептов: их записи в кэше и ETag перестают
+    совпадать. recipe_ids - список или подзапрос.
+    """
+    Recipe.objects.filter(pk__in=recipe_ids).update(updated_at=timezone.now())
@@ -0,0 +1,112 @@
+﻿"""
+Счётчик переходов по коротким ссылкам.
+
+Редирект только увеличивает счётчик в памяти процесса, а фоновый поток
+раз в SHORT_LINK_CLICKS_FLUSH_INTERVAL секунд (или раньше, когда
+накопилось SHORT_LINK_CLICKS_BUFFER_SIZE переходов) пишет накопленное в
+ShortLinkClicks одним пакетным upsert. При падении процесса теряются
+переходы не более чем за один интервал. Переходы, которые отдал из
+своего кэша nginx/CDN (постоянный редирект), до приложения не доходят и
+не считаются.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from recipes.db import upsert_increment
+from recipes.models import Recipe, ShortLinkClicks
+
+logger = logging.getLogger(__name__)
+
+
+def today():
+    """
+    Текущая дата в TIME_ZONE проекта. При USE_TZ = False localdate()
+    неприменим: now() уже наивное местное время.
+    """
+    return timezone.localdate() if settings.USE_TZ else timezone.now().date()
+
+
+class ClickBuffer:
+
+    def __init__(self, autoflush=True):
+        # autoflush=False - без фонового потока, только ручной flush().
+        self.autoflush = autoflush
+        self._lock = threading.Lock()
+        # (id рецепта, дата) -> число переходов
+        self._counts = Counter()
+        self._pending = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def record(self, recipe_id):
+        with self._lock:
+            self._counts[recipe_id, today()] += 1
+            self._pending += 1
+            full = self._pending >= settings.SHORT_LINK_CLICKS_BUFFER_SIZE
+            if self.autoflush and (
+                self._thread is None or not self._thread.is_alive()
+            ):
+                self._start()
+        if full and self.autoflush:
+            # Пишет всё равно фоновый поток, редирект его не ждёт.
+            self._wakeup.set()
+
+    def _start(self):
+        self._thread = threading.Thread(
+            target=self._loop, name="short-link-clicks", daemon=True
+        )
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(settings.SHORT_LINK_CLICKS_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Не удалось записать переходы по ссылкам")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Пишет накопленные переходы в БД, возвращает их число."""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._pending = 0
+        if not counts:
+            return 0
+        # Рецепт могли удалить, пока переход лежал в буфере.
+        existing = set(Recipe.objects.filter(
+            pk__in={recipe_id for recipe_id, _ in counts}
+        ).values_list("pk", flat=True))
+        rows = {
+            key: clicks for key, clicks in counts.items()
+            if key[0] in existing
+        }
+        try:
+            upsert_increment(
+                ShortLinkClicks, ("recipe", "date"), "clicks", rows
+            )
+        except Exception:
+            # Вернуть в буфер, чтобы записать при следующей попытке.
+            with self._lock:
+                self._counts.update(rows)
+                self._pending += sum(rows.values())
+            raise
+        return sum(rows.values())
+
+
+clicks = ClickBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        clicks.flush()
+    except Exception:
+        logger.exception("Не удалось записать переходы по ссылкам")
@@ -0,0 +1,39 @@
+﻿import io
+
+from django.conf import settings
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+
+
+class LimitedBase64ImageField(Base64ImageField):
+    """
+    Base64ImageField с ограничениями на размер загрузки.
+    Объём проверяется по длине строки ещё до декодирования base64,
+    размеры - по заголовку картинки (Pillow читает его лениво, не
+    распаковывая пиксели).
+    """
+
+    def to_internal_value(self, base64_data):
+        if (
+            isinstance(base64_data, str)
+            # base64 кодирует 3 байта четырьмя символами.
+            and len(base64_data) * 3 // 4 > settings.IMAGE_UPLOAD_MAX_BYTES
+        ):
+            raise serializers.ValidationError(
+                f"Файл больше {settings.IMAGE_UPLOAD_MAX_BYTES // 1024} КБ."
+            )
+        return super().to_internal_value(base64_data)
+
+    def get_file_extension(self, filename, decoded_file):
+        try:
+            image = Image.open(io.BytesIO(decoded_file))
+        except (OSError, UnidentifiedImageError):
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        limit = settings.IMAGE_MAX_DIMENSION
+        if max(image.size) > limit:
+            raise serializers.ValidationError(
+                f"Картинка больше {limit}x{limit} пикселей."
+            )
+        extension = (image.format or "").lower()
+        return "jpg" if extension == "jpeg" else extension
@@ -1,11 +1,23 @@
-﻿from django_filters.rest_framework import FilterSet, filters
+﻿from django.conf import settings
+from django_filters.rest_framework import FilterSet, filters
 from rest_framework.filters import SearchFilter
 from recipes.models import Recipe, User
+from .search import ingredient_index
 
 
 class IngredientSearchFilter(SearchFilter):
+    """Поиск по началу названия через индекс в памяти, без запроса к БД."""
+
     search_param = "name"
 
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "").strip()
+        if not query:
+            return queryset
+        return ingredient_index.search(
+            query, settings.INGREDIENT_SEARCH_LIMIT
+        )
+
 
 class RecipeFilter(FilterSet):
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
@@ -0,0 +1,115 @@
+﻿import json
+import re
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from api import benchmark
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет сценарии по всем маршрутам API и печатает p50/p95/p99, "
+        "запросов в секунду и SQL-запросов на запрос. Результат можно "
+        "сохранить в JSON и сравнить с прошлым прогоном."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=200,
+            help="Замеров на сценарий",
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=20,
+            help="Запросов на разогрев (кэши, индекс ингредиентов)",
+        )
+        parser.add_argument(
+            "--only", default=None,
+            help="Регулярное выражение: какие сценарии запускать",
+        )
+        parser.add_argument(
+            "--base-url", default=None,
+            help="Слать запросы по HTTP, например http://127.0.0.1:8000; "
+                 "без него - тестовый клиент в этом процессе",
+        )
+        parser.add_argument(
+            "--output", default=None, help="Сохранить результат в JSON"
+        )
+        parser.add_argument(
+            "--compare", default=None,
+            help="JSON прошлого прогона: упасть при регрессиях",
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=20,
+            help="Допустимый рост p95 в процентах",
+        )
+
+    def handle(self, *args, **options):
+        ctx = benchmark.Context.load()
+        if ctx is None:
+            raise CommandError(
+                "В базе мало данных - сначала generate_dataset."
+            )
+        scenarios = benchmark.scenarios(ctx)
+        if options["only"]:
+            pattern = re.compile(options["only"])
+            scenarios = [s for s in scenarios if pattern.search(s.name)]
+        token = benchmark.token_for(ctx.user)
+        driver = (
+            benchmark.HttpDriver(token, options["base_url"])
+            if options["base_url"] else benchmark.LocalDriver(token)
+        )
+
+        results = {}
+        self.stdout.write(
+            f"{'сценарий':<34}{'p50':>9}{'p95':>9}{'p99':>9}"
+            f"{'rps':>9}{'SQL':>5}  статусы"
+        )
+        with driver:
+            for scenario in scenarios:
+                measured = benchmark.run(
+                    driver, scenario, options["requests"], options["warmup"]
+                )
+                for name, measurement in measured.items():
+                    result = benchmark.summarize(measurement)
+                    results[name] = result
+                    queries = result["queries"]
+                    self.stdout.write(
+                        f"{name:<34}{result['p50_ms']:>9.2f}"
+                        f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+                        f"{result['rps']:>9.0f}"
+                        f"{'-' if queries is None else queries:>5}"
+                        f"  {','.join(map(str, result['statuses']))}"
+                    )
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(
+                    {
+                        "meta": {
+                            "created_at": datetime.now().isoformat(),
+                            "database": connection.vendor,
+                            "base_url": options["base_url"],
+                            "users": User.objects.count(),
+                            "recipes": Recipe.objects.count(),
+                            "requests": options["requests"],
+                        },
+                        "results": results,
+                    },
+                    file, ensure_ascii=False, indent=2,
+                )
+            self.stdout.write(f"Результат сохранён в {options['output']}")
+
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as file:
+                baseline = json.load(file)["results"]
+            regressions = benchmark.compare(
+                baseline, results, options["threshold"]
+            )
+            if regressions:
+                raise CommandError(
+                    "Регрессии производительности:\n" + "\n".join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS("Регрессий нет."))
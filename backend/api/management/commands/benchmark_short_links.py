@@ -0,0 +1,77 @@
+﻿import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.shortcuts import get_object_or_404, redirect
+from django.test import RequestFactory
+from rest_framework.views import APIView
+from api.clicks import ClickBuffer
+from api.shortlinks import short_links
+from api.views import ShortLinkRedirectView
+from recipes import shortcodes
+from recipes.models import Recipe, ShortLink
+
+
+class LegacyShortLinkRedirectView(APIView):
+    """Прежняя реализация: APIView и запрос к ShortLink на каждый переход."""
+
+    def get(self, request, short_code):
+        short_link = get_object_or_404(ShortLink, short_code=short_code)
+        return redirect(short_link.destination)
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает число переходов по короткой ссылке в секунду: прежний "
+        "APIView и текущий ShortLinkRedirectView."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=5000,
+            help="Запросов на каждый вариант",
+        )
+
+    def measure(self, view, request, code, total):
+        started = time.perf_counter()
+        for _ in range(total):
+            response = view(request, short_code=code)
+        elapsed = time.perf_counter() - started
+        if response.status_code not in (301, 302):
+            raise CommandError(f"Неожиданный ответ {response.status_code}")
+        return total / elapsed
+
+    def handle(self, *args, **options):
+        total = options["requests"]
+        recipe = Recipe.objects.first()
+        if recipe is None:
+            raise CommandError("Нет рецептов - сначала загрузите данные.")
+        with transaction.atomic():
+            link, _ = ShortLink.objects.get_or_create(
+                recipe=recipe,
+                defaults={"destination": f"/recipes/{recipe.pk}/"},
+            )
+            code = shortcodes.encode(recipe.pk)
+            short_links.clear()
+            results = {
+                "APIView + БД": self.measure(
+                    LegacyShortLinkRedirectView.as_view(),
+                    RequestFactory().get(f"/api/s/{link.short_code}/"),
+                    link.short_code, total,
+                ),
+                # Переходы считаются, но в БД не пишутся: это не
+                # настоящие переходы.
+                "View + LRU": self.measure(
+                    ShortLinkRedirectView.as_view(
+                        click_buffer=ClickBuffer(autoflush=False)
+                    ),
+                    RequestFactory().get(f"/api/s/{code}/"),
+                    code, total,
+                ),
+            }
+            transaction.set_rollback(True)
+        baseline = results["APIView + БД"]
+        for name, rps in results.items():
+            self.stdout.write(
+                f"{name:<14} {rps:>10.0f} запросов/с  x{rps / baseline:.1f}"
+            )
@@ -0,0 +1,112 @@
+﻿import io
+import pstats
+import re
+from collections import defaultdict
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from api import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        "Профили запросов из PROFILING_DIR: сводка по представлениям, "
+        "список файлов или объединённая статистика функций выбранных "
+        "представлений."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--view", default=None,
+            help="Регулярное выражение по имени представления "
+                 "(RecipeViewSet.list): напечатать статистику функций",
+        )
+        parser.add_argument(
+            "--list", action="store_true",
+            help="Перечислить профили вместо сводки",
+        )
+        parser.add_argument(
+            "--sort", default="cumulative",
+            help="Порядок статистики pstats: cumulative, tottime, calls",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=30, help="Строк статистики"
+        )
+        parser.add_argument(
+            "--match", default=None,
+            help="Регулярное выражение по файлу и функции, например "
+                 "serializers",
+        )
+        parser.add_argument(
+            "--clear", action="store_true", help="Удалить все профили"
+        )
+
+    def handle(self, *args, **options):
+        paths = profiling.profile_paths()
+        if options["clear"]:
+            for path in paths:
+                profiling.remove(path)
+            self.stdout.write(f"Удалено профилей: {len(paths)}")
+            return
+        profiles = [(path, profiling.load_meta(path) or {}) for path in paths]
+        if options["view"]:
+            pattern = re.compile(options["view"])
+            profiles = [
+                (path, meta) for path, meta in profiles
+                if pattern.search(meta.get("view") or "")
+            ]
+        if not profiles:
+            raise CommandError("Профилей нет.")
+        if options["list"]:
+            self.print_list(profiles)
+        elif options["view"]:
+            self.print_stats(profiles, options)
+        else:
+            self.print_summary(profiles)
+
+    def print_list(self, profiles):
+        for path, meta in profiles:
+            started = (
+                datetime.fromtimestamp(meta["time"]).isoformat(
+                    sep=" ", timespec="seconds"
+                ) if "time" in meta else "-"
+            )
+            self.stdout.write(
+                f"{started}  {meta.get('view') or '-':<40} "
+                f"{meta.get('status', '-'):>3} "
+                f"{meta.get('duration_ms', 0):>9.1f} мс  "
+                f"{meta.get('reason', '-'):<9} "
+                f"{'поток' if meta.get('streamed') else '':<5} "
+                f"{meta.get('method', '')} "
+                f"{meta.get('path', '')}  {path}"
+            )
+
+    def print_summary(self, profiles):
+        durations = defaultdict(list)
+        for _, meta in profiles:
+            durations[meta.get("view") or "-"].append(
+                meta.get("duration_ms", 0)
+            )
+        self.stdout.write(
+            f"{'Представление':<40} {'профилей':>8} {'среднее мс':>10} "
+            f"{'макс мс':>9}"
+        )
+        for view, values in sorted(
+            durations.items(), key=lambda item: -sum(item[1])
+        ):
+            self.stdout.write(
+                f"{view:<40} {len(values):>8} "
+                f"{sum(values) / len(values):>10.1f} {max(values):>9.1f}"
+            )
+
+    def print_stats(self, profiles, options):
+        stream = io.StringIO()
+        stats = pstats.Stats(*(path for path, _ in profiles), stream=stream)
+        stats.strip_dirs().sort_stats(options["sort"])
+        restrictions = [options["match"]] if options["match"] else []
+        stats.print_stats(*restrictions, options["limit"])
+        views = sorted({meta.get("view") or "-" for _, meta in profiles})
+        self.stdout.write(
+            f"Профилей: {len(profiles)} ({', '.join(views)})"
+        )
+        self.stdout.write(stream.getvalue())
@@ -0,0 +1,131 @@
+﻿import hashlib
+
+from django.db.models import Count, Max, Subquery
+from django.http import Http404
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+from recipes.models import Favorite, Follow, Ingredient, ShoppingCart
+from users.models import User
+
+
+def make_etag(*parts):
+    return hashlib.md5("|".join(map(str, parts)).encode()).hexdigest()
+
+
+def catalog_version():
+    """Версия каталога ингредиентов: число записей и время изменения."""
+    return Ingredient.objects.aggregate(
+        count=Count("id"), updated_at=Max("updated_at")
+    )
+
+
+def _relation_stamp(model, field, user):
+    rows = model.objects.filter(**{field: user}).order_by().values(field)
+    return (
+        Subquery(rows.annotate(value=Count("id")).values("value")),
+        Subquery(rows.annotate(value=Max("id")).values("value")),
+    )
+
+
+def relations_version(user):
+    """
+    Версия подписок, избранного и корзины пользователя.
+    Записи в этих таблицах только добавляются и удаляются, а id растут,
+    поэтому пара (количество, максимальный id) меняется при любой правке.
+    """
+    if not user.is_authenticated:
+        return None
+    stamps = {}
+    for name, model, field in (
+        ("favorites", Favorite, "author"),
+        ("carts", ShoppingCart, "author"),
+        ("follows", Follow, "user"),
+    ):
+        count, last = _relation_stamp(model, field, user)
+        stamps[f"{name}_count"] = count
+        stamps[f"{name}_last"] = last
+    return list(
+        User.objects.filter(pk=user.pk).annotate(**stamps).values_list(
+            *stamps
+        )
+    )
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы для list и retrieve.
+    Валидаторы считаются лёгкими запросами по полям updated_at; если копия
+    клиента актуальна, ответ 304 Not Modified отдаётся без сериализации.
+    Если ответ содержит флаги текущего пользователя (user_dependent),
+    они входят в ETag, а Last-Modified отдаётся только анонимам.
+    """
+
+    user_dependent = True
+
+    def get_list_version(self):
+        raise NotImplementedError
+
+    def get_object_version(self):
+        raise NotImplementedError
+
+    def get_lookup_pk(self):
+        """
+        pk объекта из URL. Нечисловой id - 404, как в get_object,
+        а не ValueError в запросе версии.
+        """
+        try:
+            return int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except (TypeError, ValueError):
+            raise Http404
+
+    def _etag(self, version):
+        if version is None:
+            return None
+        if not self.user_dependent:
+            return make_etag(self.request.get_full_path(), version)
+        user = self.request.user
+        return make_etag(
+            self.request.get_full_path(),
+            user.pk,
+            version,
+            relations_version(user),
+        )
+
+    def _last_modified(self, version):
+        if version is None or (
+            self.user_dependent and self.request.user.is_authenticated
+        ):
+            return None
+        stamps = [
+            value for value in version.values() if hasattr(value, "timestamp")
+        ]
+        return max(stamps, default=None)
+
+    def _conditional(self, handler, version_func, request, *args, **kwargs):
+        version = {}
+
+        def get_version():
+            if "value" not in version:
+                version["value"] = version_func()
+            return version["value"]
+
+        response = condition(
+            etag_func=lambda *a, **kw: self._etag(get_version()),
+            last_modified_func=lambda *a, **kw: self._last_modified(
+                get_version()
+            ),
+        )(handler)(request, *args, **kwargs)
+        if self.user_dependent:
+            patch_vary_headers(response, ("Authorization",))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(
+            super().list, self.get_list_version, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(
+            super().retrieve, self.get_object_version,
+            request, *args, **kwargs
+        )
@@ -1,6 +1,28 @@
-﻿from rest_framework.pagination import PageNumberPagination
+﻿from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class ApiPagination(PageNumberPagination):
     page_size_query_param = "limit"
     page_size = 5
+
+
+class ApiCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация по id: без COUNT(*) и OFFSET, поэтому любая
+    страница стоит столько же, сколько первая. Включается параметром
+    ?pagination=cursor.
+    Курсор DRF хранит значение только первого поля сортировки, а
+    одинаковые значения пропускает смещением, поэтому поле должно быть
+    уникальным. pub_date проставляется при вставке, и порядок id
+    совпадает с порядком публикации.
+    """
+
+    mode_query_param = "pagination"
+    mode = "cursor"
+    page_size_query_param = "limit"
+    page_size = 5
+    ordering = "-id"
+
+    @classmethod
+    def is_requested(cls, request):
+        return request.query_params.get(cls.mode_query_param) == cls.mode
@@ -0,0 +1,60 @@
+﻿"""
+Загрузка последних рецептов сразу для страницы авторов.
+
+Для каждого автора нужно не больше recipes_limit новых рецептов. Лимит
+на автора считается оконной функцией ROW_NUMBER() OVER (PARTITION BY
+author_id), так что на всю страницу уходит один запрос. Если база не
+поддерживает оконные функции (SQLite до 3.25), рецепты авторов читаются
+тем же одним запросом и обрезаются по лимиту в Python.
+"""
+from collections import defaultdict
+
+from django.db import connections, router
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from recipes.models import Recipe
+
+LATEST_RECIPES_ATTR = "latest_recipes"
+RECIPE_ORDERING = (F("pub_date").desc(), F("id").desc())
+
+
+def recipes_limit(request):
+    """Значение recipes_limit из запроса или None, если лимита нет."""
+    limit = request.GET.get("recipes_limit") if request else None
+    return int(limit) if limit and limit.isdigit() else None
+
+
+def _supports_window():
+    connection = connections[router.db_for_read(Recipe)]
+    return connection.features.supports_over_clause
+
+
+def prefetch_latest_recipes(authors, limit=None):
+    """
+    Кладёт в author.latest_recipes последние рецепты каждого автора.
+    Поля берутся только те, что нужны RecipeMiniSerializer.
+    """
+    authors = list(authors)
+    grouped = defaultdict(list)
+    if authors and limit != 0:
+        queryset = Recipe.objects.filter(
+            author_id__in={author.pk for author in authors}
+        ).only(
+            "id", "name", "image", "image_variants", "cooking_time",
+            "author_id",
+        ).order_by("author_id", *RECIPE_ORDERING)
+        if limit is not None and _supports_window():
+            queryset = queryset.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F("author_id"),
+                    order_by=RECIPE_ORDERING,
+                )
+            ).filter(row_number__lte=limit)
+        for recipe in queryset:
+            recipes = grouped[recipe.author_id]
+            if limit is None or len(recipes) < limit:
+                recipes.append(recipe)
+    for author in authors:
+        setattr(author, LATEST_RECIPES_ATTR, grouped.get(author.pk, []))
+    return authors
@@ -0,0 +1,199 @@
+﻿"""
+Профилирование живых запросов через cProfile.
+
+Профилируется доля запросов PROFILING_SAMPLE_RATE и любой запрос
+администратора с заголовком X-Profile: 1 или параметром ?profile=1.
+Результат - файл pstats и JSON с описанием запроса в PROFILING_DIR;
+хранятся последние PROFILING_MAX_FILES профилей (старые удаляются).
+Посмотреть их - manage.py profiles, открыть файл .prof - pstats,
+snakeviz или gprof2dot. Без PROFILING = True RequestProfilingMiddleware
+Django убирает из цепочки.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .timing import view_name
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PROFILE_PARAM = "profile"
+STATS_SUFFIX = ".prof"
+META_SUFFIX = ".json"
+
+
+def is_admin(request):
+    """
+    Администратор ли автор запроса. Аутентификация DRF выполняется
+    в представлении, поэтому здесь токен проверяется отдельно.
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+    drf_request = Request(request)
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = authentication_class().authenticate(drf_request)
+        except APIException:
+            return False
+        if result is not None:
+            return result[0].is_staff
+    return False
+
+
+def profile_requested(request):
+    return "1" in (
+        request.META.get(PROFILE_HEADER), request.GET.get(PROFILE_PARAM)
+    )
+
+
+def profile_paths(directory=None):
+    """Файлы профилей от старых к новым."""
+    directory = directory or settings.PROFILING_DIR
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    # Имя начинается с времени в наносекундах - порядок имён
+    # совпадает с порядком записи.
+    return [
+        os.path.join(directory, name)
+        for name in sorted(names) if name.endswith(STATS_SUFFIX)
+    ]
+
+
+def load_meta(stats_path):
+    meta_path = stats_path[:-len(STATS_SUFFIX)] + META_SUFFIX
+    try:
+        with open(meta_path, encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def remove(stats_path):
+    for path in (
+        stats_path, stats_path[:-len(STATS_SUFFIX)] + META_SUFFIX
+    ):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Его уже удалил другой процесс.
+            pass
+
+
+def new_name():
+    return f"{time.time_ns()}-{os.getpid()}"
+
+
+def save(profiler, name, meta):
+    """Пишет профиль и удаляет самые старые сверх PROFILING_MAX_FILES."""
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    stats_path = os.path.join(directory, name + STATS_SUFFIX)
+    # Сначала описание: без него профиль не попадает в сводку по
+    # представлениям, а .prof без .json команда показывает как есть.
+    with open(
+        os.path.join(directory, name + META_SUFFIX), "w", encoding="utf-8"
+    ) as file:
+        json.dump(meta, file, ensure_ascii=False)
+    profiler.dump_stats(stats_path)
+    paths = profile_paths(directory)
+    for path in paths[:max(len(paths) - settings.PROFILING_MAX_FILES, 0)]:
+        remove(path)
+
+
+def _enable(profiler):
+    try:
+        profiler.enable()
+    except ValueError:
+        # В Python 3.12+ профилировщик может работать только один:
+        # параллельный запрос в другом потоке уже профилируется.
+        return False
+    return True
+
+
+class RequestProfilingMiddleware:
+    """Профилирует выбранные запросы при PROFILING = True."""
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+
+    def reason(self, request):
+        if profile_requested(request) and is_admin(request):
+            return "requested"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    def __call__(self, request):
+        reason = self.reason(request)
+        if reason is None:
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        if not _enable(profiler):
+            return self.get_response(request)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        name = new_name()
+        meta = {
+            "time": time.time(),
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": view_name(request),
+            "status": response.status_code,
+            "reason": reason,
+            "streamed": response.streaming,
+        }
+
+        def finish():
+            meta["duration_ms"] = round(
+                (time.perf_counter() - started) * 1000, 3
+            )
+            try:
+                save(profiler, name, meta)
+            except OSError:
+                logger.exception("Не удалось сохранить профиль запроса")
+
+        response["X-Profile"] = name
+        if response.streaming and not response.is_async:
+            # Тело (файл списка покупок) генерируется уже после выхода из
+            # представления: профиль сохраняется, когда поток прочитан.
+            response.streaming_content = self._profile_stream(
+                response.streaming_content, profiler, finish
+            )
+        else:
+            finish()
+        return response
+
+    @staticmethod
+    def _profile_stream(content, profiler, finish):
+        iterator = iter(content)
+        try:
+            while True:
+                enabled = _enable(profiler)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    if enabled:
+                        profiler.disable()
+                yield chunk
+        finally:
+            finish()
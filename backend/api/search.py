@@ -0,0 +1,97 @@
+﻿"""
+Индекс префиксного поиска ингредиентов в памяти процесса.
+
+Каталог хранится отсортированным по casefold-названию, поиск префикса -
+двоичный поиск по списку без обращения к БД. Индекс строится лениво.
+Версия каталога (число записей и наибольший updated_at, catalog_version)
+читается из БД не чаще раза в INGREDIENT_INDEX_CHECK_INTERVAL секунд:
+правки из других процессов и команд, в том числе bulk_create без
+сигналов, видны не позже чем через этот интервал, а в своём процессе
+сигналы проверяют версию сразу после коммита. Версия служит и ETag
+списка ингредиентов.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import transaction
+from recipes.models import Ingredient
+from .mixins import catalog_version
+
+
+class IngredientPrefixIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (версия, ключи для bisect, строки каталога) меняются одним
+        # присваиванием.
+        self._index = None
+        self._checked_at = None
+
+    def invalidate(self):
+        """Проверить версию каталога при следующем поиске."""
+        transaction.on_commit(self._expire)
+
+    def _expire(self):
+        self._checked_at = None
+
+    def _is_checked(self):
+        checked_at = self._checked_at
+        return (
+            self._index is not None
+            and checked_at is not None
+            and time.monotonic() - checked_at
+            < settings.INGREDIENT_INDEX_CHECK_INTERVAL
+        )
+
+    def _get_index(self):
+        index = self._index
+        if self._is_checked():
+            return index
+        with self._lock:
+            if self._is_checked():
+                return self._index
+            # Версия читается до строк: если каталог изменится между
+            # запросами, следующая проверка увидит новую версию.
+            version = catalog_version()
+            if self._index is None or self._index[0] != version:
+                rows = sorted(
+                    (name.casefold(), pk, name, measurement_unit)
+                    for pk, name, measurement_unit
+                    in Ingredient.objects.values_list(
+                        "id", "name", "measurement_unit"
+                    )
+                )
+                self._index = (version, [row[0] for row in rows], rows)
+            self._checked_at = time.monotonic()
+            return self._index
+
+    @property
+    def version(self):
+        """Версия каталога, по которой построен индекс."""
+        return self._get_index()[0]
+
+    def search(self, query, limit=None):
+        """
+        Ингредиенты, название которых начинается с query без учёта
+        регистра. Первыми идут точные совпадения названия: в порядке
+        casefold строка, равная префиксу, меньше всех его продолжений.
+        Дальше - по алфавиту.
+        """
+        _, keys, rows = self._get_index()
+        prefix = query.casefold()
+        found = []
+        for position in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[position].startswith(prefix):
+                break
+            found.append(rows[position])
+            if limit and len(found) >= limit:
+                break
+        return [
+            Ingredient(id=pk, name=name, measurement_unit=measurement_unit)
+            for _, pk, name, measurement_unit in found
+        ]
+
+
+ingredient_index = IngredientPrefixIndex()
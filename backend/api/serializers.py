@@ -1,8 +1,9 @@
 ﻿from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from drf_extra_fields.fields import Base64ImageField
 from django.shortcuts import get_object_or_404
-from django.db.models import QuerySet
+from django.db import transaction
+from django.db.models import Prefetch, QuerySet, prefetch_related_objects
+from django.db.models.manager import BaseManager
 from django.urls import reverse
 from urllib.parse import urljoin
 from recipes.models import (
@@ -12,9 +13,16 @@ from recipes.models import (
     ShoppingCart,
     Favorite,
     Follow,
-    ShortLink,
+    ShortLinkClicks,
 )
+from recipes import images, shopping_list, shortcodes, timeline
+from recipes.relations import for_request
+from users.models import User
 from users.serializers import UserSerializer
+from . import cache as recipe_cache
+from .fields import LimitedBase64ImageField
+from .prefetch import LATEST_RECIPES_ATTR, recipes_limit
+from .timing import TimedListSerializer, TimedSerializerMixin
 from http import HTTPStatus
 
 MIN_AMOUNT = 1
@@ -22,7 +30,7 @@ MAX_AMOUNT = 32000
 MIN_COOKING_TIME = 1
 MAX_COOKING_TIME = 32000
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer для Подписок."""
     id = serializers.PrimaryKeyRelatedField(read_only=True)
     name = serializers.ReadOnlyField()
@@ -40,7 +48,9 @@ class FavoriteSerializer(serializers.ModelSerializer):
         return None
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
+class ShoppingCartSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     """Serializer для Корзины."""
     id = serializers.PrimaryKeyRelatedField(read_only=True)
     name = serializers.ReadOnlyField()
@@ -84,9 +94,57 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit", "amount")
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
+class RecipeCacheSerializer(serializers.ModelSerializer):
+    """Пользователь-независимые поля рецепта, которые хранятся в кэше."""
+
+    ingredients = IngredientRecipeSerializer(
+        many=True, source="recipe_ingredients", read_only=True
+    )
+    image_variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = (
+            "id", "ingredients", "name", "image", "image_variants", "text",
+            "cooking_time",
+        )
+
+    def get_image_variants(self, obj):
+        return images.variant_urls(obj.image, obj.image_variants)
+
+
+class AuthorCacheSerializer(serializers.ModelSerializer):
+    """Пользователь-независимые поля автора, которые хранятся в кэше."""
+
+    avatar_variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = (
+            "id", "email", "username", "first_name", "last_name", "avatar",
+            "avatar_variants",
+        )
+
+    def get_avatar_variants(self, obj):
+        return images.variant_urls(obj.avatar, obj.avatar_variants)
+
+
+class CachedRecipeListSerializer(
+    TimedSerializerMixin, serializers.ListSerializer
+):
+    """Достаёт из кэша все рецепты страницы одним обращением."""
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, BaseManager) else data)
+        self.child.load_cached(recipes)
+        return super().to_representation(recipes)
+
+
+class RecipeListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer для Рецептов.
+    Общая для всех пользователей часть берётся из кэша,
+    флаги текущего пользователя подмешиваются при ответе.
     """
 
     author = UserSerializer()
@@ -98,6 +156,7 @@ class RecipeListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
+        list_serializer_class = CachedRecipeListSerializer
         fields = (
             "id",
             "author",
@@ -106,20 +165,91 @@ class RecipeListSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_variants",
             "text",
             "cooking_time",
         )
 
+    def load_cached(self, recipes):
+        """Загружает рецепты и авторов из кэша, ингредиенты - только
+        для промахов."""
+        self._cached_recipes = recipe_cache.get_many(
+            recipe_cache.RECIPE_KEY, recipes
+        )
+        self._cached_authors = recipe_cache.get_many(
+            recipe_cache.AUTHOR_KEY, {recipe.author for recipe in recipes}
+        )
+        prefetch_related_objects(
+            [
+                recipe for recipe in recipes
+                if recipe.pk not in self._cached_recipes
+            ],
+            Prefetch(
+                "recipe_ingredients",
+                queryset=IngredientRecipe.objects.select_related("ingredient"),
+            ),
+        )
+
+    def _from_cache(self, cached, key_template, serializer_class, instance):
+        if instance.pk not in cached:
+            cached[instance.pk] = dict(serializer_class(instance).data)
+            if self.context.get("store_in_cache", True):
+                recipe_cache.store(
+                    key_template, instance, cached[instance.pk]
+                )
+        return cached[instance.pk]
+
+    def _absolute_url(self, url):
+        request = self.context.get("request")
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def to_representation(self, instance):
+        if not hasattr(self, "_cached_recipes"):
+            self.load_cached([instance])
+        recipe = self._from_cache(
+            self._cached_recipes, recipe_cache.RECIPE_KEY,
+            RecipeCacheSerializer, instance,
+        )
+        author = self._from_cache(
+            self._cached_authors, recipe_cache.AUTHOR_KEY,
+            AuthorCacheSerializer, instance.author,
+        )
+        author = dict(
+            author,
+            is_subscribed=self.fields["author"].get_is_subscribed(
+                instance.author
+            ),
+            avatar=self._absolute_url(author["avatar"]),
+            avatar_variants=images.absolute_urls(
+                self.context.get("request"), author["avatar_variants"]
+            ),
+        )
+        user_fields = {
+            "author": {
+                field: author[field] for field in UserSerializer.Meta.fields
+            },
+            "is_favorited": self.get_is_favorited(instance),
+            "is_in_shopping_cart": self.get_is_in_shopping_cart(instance),
+            "image": self._absolute_url(recipe["image"]),
+            "image_variants": images.absolute_urls(
+                self.context.get("request"), recipe["image_variants"]
+            ),
+        }
+        return {
+            field: user_fields[field] if field in user_fields
+            else recipe[field]
+            for field in self.Meta.fields
+        }
 
     def get_is_favorited(self, obj) -> bool:
-        request = self.context["request"]
-        return request.user.is_authenticated and obj.favorite.filter(
-            author=request.user).exists()
+        relations = for_request(self.context.get("request"))
+        return obj.pk in relations.favorites
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context["request"]
-        return (request.user.is_authenticated
-            and obj.shopping_cart.filter(author=request.user).exists())
+        relations = for_request(self.context.get("request"))
+        return obj.pk in relations.cart
 
 
 class AddIngredientSerializer(serializers.ModelSerializer):
@@ -127,7 +257,9 @@ class AddIngredientSerializer(serializers.ModelSerializer):
     Serializer для поля ingredient модели Recipe - создание ингредиентов.
     """
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    # Существование ингредиентов проверяется одним запросом
+    # в RecipeWriteSerializer.validate_ingredients.
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(
         min_value=MIN_AMOUNT, max_value=MAX_AMOUNT)
 
@@ -136,11 +268,13 @@ class AddIngredientSerializer(serializers.ModelSerializer):
         fields = ("id", "amount")
 
 
-class RecipeWriteSerializer(serializers.ModelSerializer):
+class RecipeWriteSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     """Serializer для модели Recipe - запись / обновление / удаление данных."""
 
     ingredients = AddIngredientSerializer(many=True, write_only=True)
-    image = Base64ImageField()
+    image = LimitedBase64ImageField()
     author = serializers.HiddenField(default=serializers.CurrentUserDefault())
     cooking_time = serializers.IntegerField(
         min_value=MIN_COOKING_TIME, max_value=MAX_COOKING_TIME
@@ -178,13 +312,26 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 code=HTTPStatus.BAD_REQUEST,
             )
 
-        ingredient_ids = [item["id"].id for item in value]
+        ingredient_ids = [item["id"] for item in value]
         if len(ingredient_ids) != len(set(ingredient_ids)):
             raise ValidationError(
                 {"ingredients": "Ингредиенты не должны повторяться!"},
                 code=HTTPStatus.BAD_REQUEST,
             )
 
+        existing = set(
+            Ingredient.objects.filter(id__in=ingredient_ids).values_list(
+                "id", flat=True
+            )
+        )
+        missing = [pk for pk in ingredient_ids if pk not in existing]
+        if missing:
+            raise ValidationError(
+                {"ingredients": "Ингредиенты не найдены: "
+                 + ", ".join(map(str, missing))},
+                code=HTTPStatus.BAD_REQUEST,
+            )
+
         return value
 
     def create_ingredients(self, recipe, ingredients):
@@ -192,41 +339,84 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             [
                 IngredientRecipe(
                     recipe=recipe,
-                    ingredient=ingredient["id"],
+                    ingredient_id=ingredient["id"],
                     amount=ingredient["amount"],
                 )
                 for ingredient in ingredients
             ]
         )
 
+    def update_ingredients(self, recipe, ingredients):
+        """
+        Записывает только разницу между старым и новым составом.
+        Возвращает старые количества {ingredient_id: amount}.
+        """
+        current = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: row.amount for ingredient_id, row in current.items()
+        }
+        to_create, to_update = [], []
+        for ingredient in ingredients:
+            row = current.pop(ingredient["id"], None)
+            if row is None:
+                to_create.append(ingredient)
+            elif row.amount != ingredient["amount"]:
+                row.amount = ingredient["amount"]
+                to_update.append(row)
+        if current:
+            IngredientRecipe.objects.filter(
+                pk__in=[row.pk for row in current.values()]
+            ).delete()
+        IngredientRecipe.objects.bulk_update(to_update, ["amount"])
+        self.create_ingredients(recipe, to_create)
+        return old_amounts
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop("ingredients")
         recipe = super().create(validated_data)
         self.create_ingredients(recipe, ingredients)
+        timeline.push_recipe(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop("ingredients")
-        instance.ingredients.clear()
         instance = super().update(instance, validated_data)
-        self.create_ingredients(instance, ingredients)
+        old_amounts = self.update_ingredients(instance, ingredients)
+        new_amounts = {item["id"]: item["amount"] for item in ingredients}
+        if old_amounts != new_amounts:
+            shopping_list.recipe_changed(instance.id, old_amounts)
         return instance
 
     def to_representation(self, instance):
         request = self.context.get("request")
-        context = {"request": request}
+        # Копии картинки готовятся уже после ответа, поэтому ответ на
+        # запись в кэш не попадает.
+        context = {"request": request, "store_in_cache": False}
         return RecipeListSerializer(instance, context=context).data
 
 
 class RecipeMiniSerializer(serializers.ModelSerializer):
     """Упрощённый сериализатор для рецептов в подписках."""
 
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_variants", "cooking_time")
+
+    def get_image_variants(self, obj):
+        return images.absolute_urls(
+            self.context.get("request"),
+            images.variant_urls(obj.image, obj.image_variants),
+        )
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer подписок с информацией об авторе и его рецептах."""
 
     email = serializers.ReadOnlyField(source="author.email")
@@ -241,6 +431,7 @@ class FollowSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Follow
+        list_serializer_class = TimedListSerializer
         fields = (
             "email",
             "id",
@@ -254,25 +445,28 @@ class FollowSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj) -> bool:
-        return True
+        relations = for_request(self.context.get("request"))
+        return obj.author_id in relations.followed
 
     def _get_author_recipes(self, author) -> QuerySet:
         """Возвращает QuerySet рецептов автора с учётом лимита."""
-        request = self.context.get("request")
-        limit = request.GET.get("recipes_limit")
+        limit = recipes_limit(self.context.get("request"))
         queryset = author.recipes.all()
-        return (
-            queryset[: int(limit)] if limit and limit.isdigit() else queryset
-        )
+        return queryset if limit is None else queryset[:limit]
 
     def get_recipes(self, obj) -> list:
-        """Список рецептов автора."""
-        recipes = self._get_author_recipes(obj.author)
+        """
+        Список рецептов автора. Для страницы подписок рецепты заранее
+        загружены prefetch_latest_recipes.
+        """
+        recipes = getattr(obj.author, LATEST_RECIPES_ATTR, None)
+        if recipes is None:
+            recipes = self._get_author_recipes(obj.author)
         return RecipeMiniSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj) -> int:
-        """Количество рецептов автора (оптимизация через кэш QuerySet)."""
-        return obj.author.recipes.count()
+        """Количество рецептов автора (денормализованный счётчик)."""
+        return obj.author.recipes_count
 
     def get_avatar(self, obj):
         request = self.context.get('request')
@@ -280,31 +474,16 @@ class FollowSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.author.avatar.url)
         return None
 
-    def validate(self, data):
-        """Проверка возможности подписки."""
-        author = self.context["author"]
-        user = self.context["request"].user
-
-        if user == author:
-            raise ValidationError(
-                "Нельзя подписаться на себя!", code=HTTPStatus.BAD_REQUEST)
-        if user.follower.filter(author=author).exists():
-            raise ValidationError(
-                "Вы уже подписаны!", code=HTTPStatus.BAD_REQUEST)
-        return data
 
+class ShortLinkSerializer(TimedSerializerMixin, serializers.Serializer):
+    """Короткая ссылка рецепта: код вычисляется из id, без записи в БД."""
 
-class ShortLinkSerializer(serializers.ModelSerializer):
     short_link = serializers.SerializerMethodField()
 
-    class Meta:
-        model = ShortLink
-        fields = ('short_link',)
-
     def get_short_link(self, obj):
         request = self.context.get('request')
         return request.build_absolute_uri(
-            reverse('short-link-redirect', args=[obj.short_code])
+            reverse('short-link-redirect', args=[shortcodes.encode(obj.pk)])
         )
 
     def to_representation(self, instance):
@@ -312,3 +491,13 @@ class ShortLinkSerializer(serializers.ModelSerializer):
         data['short-link'] = data.pop('short_link')
         return data
 
+
+class ShortLinkClicksSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
+    """Переходы по короткой ссылке за день."""
+
+    class Meta:
+        model = ShortLinkClicks
+        list_serializer_class = TimedListSerializer
+        fields = ("date", "clicks")
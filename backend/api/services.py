@@ -1,27 +1,151 @@
-﻿from django.db.models import Sum
+﻿import csv
+import io
+import json
+import os
 from datetime import date
-from django.http import HttpResponse
-from recipes.models import IngredientRecipe
-
-
-def shopping_cart(self, request, author):
-    """Скачивание txt-файла продуктов для выбранных рецептов пользователя."""
-    sum_ingredients_in_recipes = IngredientRecipe.objects.filter(
-        recipe__shopping_cart__author=author
-    ).values(
-        'ingredient__name', 'ingredient__measurement_unit'
-    ).annotate(
-        amounts=Sum('amount', distinct=True)).order_by('amounts')
-    today = date.today().strftime("%d-%m-%Y")
-    shopping_list = f'Список покупок на: {today}\n\n'
-    for ingredient in sum_ingredients_in_recipes:
-        shopping_list += (
-            f'{ingredient["ingredient__name"]} - '
-            f'{ingredient["amounts"]} '
-            f'{ingredient["ingredient__measurement_unit"]}\n'
+
+from django.conf import settings
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from recipes.models import ShoppingListItem
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+except ImportError:
+    canvas = None
+
+ROWS_CHUNK_SIZE = 500
+PDF_FONT_NAME = "ShoppingListFont"
+FOOTER = 'Благодарим за использование Foodgram (2025)'
+
+
+def shopping_list_rows(author):
+    """
+    Итоги ингредиентов из корзины пользователя - чтение по индексу из
+    ShoppingListItem. Читаются порциями через серверный курсор.
+    """
+    return ShoppingListItem.objects.filter(user=author).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        amounts=F('total_amount'),
+    ).order_by('ingredient__name').iterator(chunk_size=ROWS_CHUNK_SIZE)
+
+
+def _title():
+    return f'Список покупок на: {date.today().strftime("%d-%m-%Y")}'
+
+
+def _line(ingredient):
+    return (
+        f'{ingredient["ingredient__name"]} - '
+        f'{ingredient["amounts"]} '
+        f'{ingredient["ingredient__measurement_unit"]}'
+    )
+
+
+def stream_txt(rows):
+    yield f'{_title()}\n\n'
+    for ingredient in rows:
+        yield f'{_line(ingredient)}\n'
+    yield f'\n\n{FOOTER}'
+
+
+class _Echo:
+    """Буфер для csv.writer, который сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for ingredient in rows:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['amounts'],
+            ingredient['ingredient__measurement_unit'],
+        ))
+
+
+def stream_json(rows):
+    yield '{"date": %s, "ingredients": [' % json.dumps(
+        date.today().isoformat()
+    )
+    separator = ''
+    for ingredient in rows:
+        yield separator + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'amount': ingredient['amounts'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+        }, ensure_ascii=False)
+        separator = ', '
+    yield ']}'
+
+
+def pdf_available():
+    return canvas is not None and os.path.exists(settings.SHOPPING_LIST_FONT)
+
+
+def stream_pdf(rows):
+    """
+    PDF для печати. Таблица ссылок PDF пишется в конце документа,
+    поэтому файл собирается целиком и отдаётся одним блоком.
+    """
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_FONT)
         )
-    shopping_list += '\n\nБлагодарим за использование Foodgram (2025)'
-    filename = 'shopping_list.txt'
-    response = HttpResponse(shopping_list, content_type='text/plain')
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin, line_height = 50, 18
+    y = height - margin
+
+    def write(text, size=12):
+        nonlocal y
+        if y < margin:
+            pdf.showPage()
+            y = height - margin
+        pdf.setFont(PDF_FONT_NAME, size)
+        pdf.drawString(margin, y, text)
+        y -= line_height
+
+    write(_title(), size=16)
+    y -= line_height
+    for ingredient in rows:
+        write(f'□ {_line(ingredient)}')
+    y -= line_height
+    write(FOOTER, size=10)
+    pdf.save()
+    yield buffer.getvalue()
+
+
+# Формат: (генератор, content-type).
+SHOPPING_LIST_FORMATS = {
+    'txt': (stream_txt, 'text/plain; charset=utf-8'),
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'json': (stream_json, 'application/json'),
+    'pdf': (stream_pdf, 'application/pdf'),
+}
+
+
+def available_formats():
+    return [
+        name for name in SHOPPING_LIST_FORMATS
+        if name != 'pdf' or pdf_available()
+    ]
+
+
+def shopping_cart(self, request, author, file_format='txt'):
+    """Скачивание списка продуктов для выбранных рецептов пользователя."""
+    stream, content_type = SHOPPING_LIST_FORMATS[file_format]
+    response = StreamingHttpResponse(
+        stream(shopping_list_rows(author)), content_type=content_type
+    )
+    filename = f'shopping_list.{file_format}'
     response['Content-Disposition'] = f'attachment; filename={filename}'
     return response
@@ -0,0 +1,82 @@
+﻿"""
+Кэш коротких ссылок в памяти процесса: код -> (рецепт, адрес назначения).
+
+Новые коды расшифровываются в id рецепта (recipes/shortcodes.py), из БД
+нужна только проверка, что рецепт существует. Старые случайные коды
+ищутся в ShortLink.
+
+Самый нагруженный URL сервиса отвечает из LRU без обращения к БД.
+Несуществующие коды тоже кэшируются (с коротким TTL), чтобы перебор
+случайных кодов не превращался в поток запросов к ShortLink.
+Сигналы на ShortLink сбрасывают запись в своём процессе; в остальных
+процессах удалённая ссылка живёт не дольше SHORT_LINK_CACHE_TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from recipes import shortcodes
+from recipes.models import Recipe, ShortLink
+
+# Запись о несуществующем коде.
+MISSING = None
+
+
+class ShortLinkCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # код -> ((id рецепта, адрес) или MISSING, время истечения)
+        self._entries = OrderedDict()
+
+    def _get(self, code):
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry is None:
+                return False, None
+            link, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[code]
+                return False, None
+            self._entries.move_to_end(code)
+            return True, link
+
+    def _set(self, code, link):
+        ttl = (
+            settings.SHORT_LINK_CACHE_TTL if link is not MISSING
+            else settings.SHORT_LINK_NEGATIVE_TTL
+        )
+        with self._lock:
+            self._entries[code] = (link, time.monotonic() + ttl)
+            self._entries.move_to_end(code)
+            while len(self._entries) > settings.SHORT_LINK_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def resolve(self, code):
+        """(id рецепта, адрес назначения) для кода или None, если кода нет."""
+        found, link = self._get(code)
+        if found:
+            return link
+        recipe_id = shortcodes.decode(code)
+        if recipe_id is None:
+            link = ShortLink.objects.filter(short_code=code).values_list(
+                "recipe_id", "destination"
+            ).first()
+        elif Recipe.objects.filter(pk=recipe_id).exists():
+            link = (recipe_id, shortcodes.destination(recipe_id))
+        else:
+            link = MISSING
+        self._set(code, link)
+        return link
+
+    def invalidate(self, code):
+        with self._lock:
+            self._entries.pop(code, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+short_links = ShortLinkCache()
@@ -0,0 +1,70 @@
+﻿from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+from recipes.models import Ingredient, IngredientRecipe, Recipe, ShortLink
+from rest_framework.authtoken.models import Token
+from users.models import User
+from . import authentication, cache
+from .search import ingredient_index
+from recipes import shortcodes
+from .shortlinks import short_links
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_recipe_ingredients(sender, instance, action, reverse,
+                             pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        cache.touch_recipes([instance.pk])
+    elif pk_set:
+        cache.touch_recipes(pk_set)
+
+
+@receiver(post_save, sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, created, **kwargs):
+    if created:
+        return
+    cache.touch_recipes(
+        IngredientRecipe.objects.filter(ingredient=instance).values("recipe")
+    )
+
+
+@receiver(pre_delete, sender=Ingredient)
+def touch_deleted_ingredient_recipes(sender, instance, **kwargs):
+    # После удаления связей рецепты уже не найти.
+    cache.touch_recipes(
+        IngredientRecipe.objects.filter(ingredient=instance).values("recipe")
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    authentication.invalidate([instance.key])
+    # Новый updated_at делает записи о токенах пользователя
+    # недействительными и в кэшах других процессов.
+    User.objects.filter(pk=instance.user_id).update(
+        updated_at=timezone.now()
+    )
+
+
+@receiver(post_save, sender=ShortLink)
+@receiver(post_delete, sender=ShortLink)
+def invalidate_short_link(sender, instance, **kwargs):
+    short_links.invalidate(instance.short_code)
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_short_link(sender, instance, **kwargs):
+    short_links.invalidate(shortcodes.encode(instance.pk))
@@ -0,0 +1,62 @@
+﻿from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+from api.authentication import _cache_key
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    """Кэш токенов не отдаёт устаревших пользователей и отозванных токенов."""
+
+    def setUp(self):
+        caches[settings.AUTH_TOKEN_CACHE_ALIAS].clear()
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="x",
+            first_name="Автор", last_name="Тестовый",
+        )
+        self.reader = User.objects.create_user(
+            username="reader", email="reader@example.com", password="x",
+            first_name="Читатель", last_name="Тестовый",
+        )
+        self.token = Token.objects.create(user=self.author).key
+
+    def client_for(self, token):
+        client = APIClient(SERVER_NAME="localhost")
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+        return client
+
+    def test_password_change_keeps_counters(self):
+        author = self.client_for(self.token)
+        self.assertEqual(author.get("/api/users/me/").status_code, 200)
+        reader = self.client_for(Token.objects.create(user=self.reader).key)
+        response = reader.post(f"/api/users/{self.author.pk}/subscribe/")
+        self.assertEqual(response.status_code, 201)
+
+        response = author.post("/api/users/set_password/", {
+            "current_password": "x", "new_password": "Nn8-kq2vT!zr",
+        })
+        self.assertEqual(response.status_code, 204)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertTrue(self.author.check_password("Nn8-kq2vT!zr"))
+
+    def test_logout_revokes_token_in_other_processes(self):
+        author = self.client_for(self.token)
+        self.assertEqual(author.get("/api/users/me/").status_code, 200)
+        cache = caches[settings.AUTH_TOKEN_CACHE_ALIAS]
+        entry = cache.get(_cache_key(self.token))
+        self.assertIsNotNone(entry)
+
+        response = author.post("/api/auth/token/logout/")
+        self.assertEqual(response.status_code, 204)
+        # Кэш другого процесса: выход там запись не удалил.
+        cache.set(_cache_key(self.token), entry)
+        self.assertEqual(author.get("/api/users/me/").status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        author = self.client_for(self.token)
+        self.assertEqual(author.get("/api/users/me/").status_code, 200)
+        User.objects.filter(pk=self.author.pk).update(is_active=False)
+        self.assertEqual(author.get("/api/users/me/").status_code, 401)
@@ -0,0 +1,93 @@
+﻿import base64
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from PIL import Image
+from recipes.models import Favorite, Follow, Ingredient, Recipe
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+from api.serializers import RecipeWriteSerializer
+
+
+def image_data():
+    buffer = io.BytesIO()
+    Image.new("RGB", (1, 1)).save(buffer, "PNG")
+    return "data:image/png;base64," + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+class CounterSaveTest(TestCase):
+    """
+    Счётчик, изменённый другим запросом между чтением объекта и его
+    сохранением, не затирается копией из памяти.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="x",
+            first_name="Автор", last_name="Тестовый",
+        )
+        self.reader = User.objects.create_user(
+            username="reader", email="reader@example.com", password="x",
+            first_name="Читатель", last_name="Тестовый",
+        )
+        self.ingredient = Ingredient.objects.create(
+            name="соль", measurement_unit="г"
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name="Рецепт", text="Текст", cooking_time=10,
+        )
+
+    def test_recipe_patch_keeps_favorites_count(self):
+        original = RecipeWriteSerializer.update
+        reader = self.reader
+
+        def update(serializer, instance, validated_data):
+            # Рецепт уже прочитан представлением: в памяти счётчик 0.
+            Favorite.objects.create(author=reader, recipe=instance)
+            return original(serializer, instance, validated_data)
+
+        token = Token.objects.create(user=self.author).key
+        client = APIClient(SERVER_NAME="localhost")
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+        with override_settings(MEDIA_ROOT=self.media_root), \
+                mock.patch.object(RecipeWriteSerializer, "update", update):
+            response = client.patch(
+                f"/api/recipes/{self.recipe.pk}/",
+                {
+                    "ingredients": [
+                        {"id": self.ingredient.pk, "amount": 5}
+                    ],
+                    "image": image_data(),
+                    "name": "Новое название",
+                    "text": "Текст",
+                    "cooking_time": 15,
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, "Новое название")
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_user_save_keeps_followers_count(self):
+        author = User.objects.get(pk=self.author.pk)
+        Follow.objects.create(user=self.reader, author=self.author)
+        author.first_name = "Новое имя"
+        author.save()
+        author.refresh_from_db()
+        self.assertEqual(author.first_name, "Новое имя")
+        self.assertEqual(author.followers_count, 1)
+
+    def test_counter_saved_when_requested(self):
+        self.recipe.favorites_count = 7
+        self.recipe.save(update_fields=["favorites_count"])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 7)
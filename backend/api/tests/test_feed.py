@@ -0,0 +1,70 @@
+﻿from django.test import TestCase, override_settings
+from recipes import timeline
+from recipes.models import Follow, Recipe
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+
+def make_user(name):
+    return User.objects.create_user(
+        username=name, email=f"{name}@example.com", password="x",
+        first_name=name, last_name="Тестовый",
+    )
+
+
+@override_settings(TIMELINE_CELEBRITY_FOLLOWERS=2)
+class FeedTest(TestCase):
+    """
+    Лента из записей TimelineEntry и рецептов популярных авторов
+    листается курсором вперёд и назад без пропусков и повторов.
+    """
+
+    def setUp(self):
+        self.reader = make_user("reader")
+        other = make_user("other")
+        author = make_user("author")
+        celebrity = make_user("celebrity")
+        stranger = make_user("stranger")
+        Follow.objects.create(user=self.reader, author=author)
+        Follow.objects.create(user=self.reader, author=celebrity)
+        Follow.objects.create(user=other, author=celebrity)
+        self.expected = []
+        for number in range(7):
+            for recipe_author in (author, celebrity, stranger):
+                recipe = Recipe.objects.create(
+                    author=recipe_author, name=f"Рецепт {number}",
+                    text="Текст", cooking_time=10,
+                )
+                timeline.push_recipe(recipe)
+                if recipe_author != stranger:
+                    self.expected.append(recipe.pk)
+        self.expected.reverse()
+        self.client = APIClient(SERVER_NAME="localhost")
+        token = Token.objects.create(user=self.reader).key
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_pages_forward_and_back(self):
+        pages = []
+        data = self.get("/api/recipes/feed/?limit=3")
+        while True:
+            pages.append([item["id"] for item in data["results"]])
+            if not data["next"]:
+                break
+            data = self.get(data["next"])
+        self.assertEqual(sum(pages, []), self.expected)
+
+        back = []
+        while data["previous"]:
+            data = self.get(data["previous"])
+            back.insert(0, [item["id"] for item in data["results"]])
+        self.assertEqual(back, pages[:-1])
+
+    def test_bad_cursor(self):
+        response = self.client.get("/api/recipes/feed/?cursor=bad")
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,127 @@
+﻿from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+RECIPES = 30
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+class RecipeQueriesTest(TestCase):
+    """Число SQL-запросов на чтение рецептов не зависит от их количества."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="x",
+            first_name="Читатель", last_name="Тестовый",
+        )
+        authors = [
+            User.objects.create_user(
+                username=f"author{number}",
+                email=f"author{number}@example.com",
+                password="x", first_name="Автор", last_name=str(number),
+            )
+            for number in range(3)
+        ]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"ингредиент {number}", measurement_unit="г")
+            for number in range(5)
+        )
+        recipes = [
+            Recipe.objects.create(
+                author=authors[number % len(authors)],
+                name=f"Рецепт {number}",
+                text="Текст",
+                cooking_time=10,
+            )
+            for number in range(RECIPES)
+        ]
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=10)
+            for recipe in recipes
+            for ingredient in ingredients[:3]
+        )
+        for recipe in recipes[::2]:
+            Favorite.objects.create(author=cls.user, recipe=recipe)
+        for recipe in recipes[::3]:
+            ShoppingCart.objects.create(author=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=authors[0])
+        cls.recipe = recipes[0]
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        # Холодные кэши рецептов и токенов: худший случай по запросам.
+        clear_caches()
+        self.client = APIClient(SERVER_NAME="localhost")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def count_queries(self, path):
+        with self.assertNumQueries(self.expected) as context:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, context
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        # Токен, версия страницы для ETag, версия связей пользователя,
+        # COUNT, страница с авторами, ингредиенты, связи пользователя.
+        self.expected = 7
+        for limit in (2, RECIPES):
+            with self.subTest(limit=limit):
+                clear_caches()
+                response, _ = self.count_queries(
+                    f"/api/recipes/?limit={limit}"
+                )
+                self.assertEqual(len(response.data["results"]), limit)
+
+    def test_list_flags(self):
+        self.expected = 7
+        response, _ = self.count_queries(f"/api/recipes/?limit={RECIPES}")
+        results = {item["id"]: item for item in response.data["results"]}
+        recipe = results[self.recipe.pk]
+        self.assertTrue(recipe["is_favorited"])
+        self.assertTrue(recipe["is_in_shopping_cart"])
+        self.assertTrue(recipe["author"]["is_subscribed"])
+        self.assertEqual(len(recipe["ingredients"]), 3)
+
+    def test_detail_queries(self):
+        # Токен, версия рецепта, версия связей, рецепт с автором, связи
+        # пользователя, ингредиенты.
+        self.expected = 6
+        self.count_queries(f"/api/recipes/{self.recipe.pk}/")
+
+    def test_list_etag_follows_page(self):
+        path = "/api/recipes/?limit=2"
+        etag = self.client.get(path)["ETag"]
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Правка рецепта за пределами страницы её не меняет.
+        last = Recipe.objects.order_by("pub_date").first()
+        last.name = "Старый рецепт"
+        last.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        first = Recipe.objects.order_by("-pub_date").first()
+        first.name = "Новое название"
+        first.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["results"][0]["name"], "Новое название"
+        )
@@ -0,0 +1,111 @@
+﻿from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+from django.test import TransactionTestCase
+from recipes.models import Favorite, Follow, Recipe, ShoppingCart
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+THREADS = 8
+REQUESTS = 24
+
+
+class ConcurrentTogglesTest(TransactionTestCase):
+    """
+    Одновременные запросы на одну пару пользователь-рецепт/автор:
+    никаких 500, ровно один успешный запрос и ровно одна запись.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="x",
+            first_name="Читатель", last_name="Тестовый",
+        )
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="x",
+            first_name="Автор", last_name="Тестовый",
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name="Рецепт", text="Текст", cooking_time=10,
+        )
+        self.token = Token.objects.create(user=self.user).key
+
+    def request(self, method, path):
+        client = APIClient(SERVER_NAME="localhost")
+        client.credentials(HTTP_AUTHORIZATION=f"Token {self.token}")
+        try:
+            return getattr(client, method)(path).status_code
+        finally:
+            # Соединение с БД этого потока.
+            connections.close_all()
+
+    def hammer(self, method, path):
+        with ThreadPoolExecutor(max_workers=THREADS) as pool:
+            return list(pool.map(
+                lambda _: self.request(method, path), range(REQUESTS)
+            ))
+
+    def check_toggle(self, path, rows):
+        statuses = self.hammer("post", path)
+        self.assertEqual(statuses.count(201), 1, statuses)
+        self.assertEqual(statuses.count(400), REQUESTS - 1, statuses)
+        self.assertEqual(rows().count(), 1)
+
+        statuses = self.hammer("delete", path)
+        self.assertEqual(statuses.count(204), 1, statuses)
+        self.assertEqual(statuses.count(400), REQUESTS - 1, statuses)
+        self.assertEqual(rows().count(), 0)
+
+    def test_favorite(self):
+        self.check_toggle(
+            f"/api/recipes/{self.recipe.pk}/favorite/",
+            lambda: Favorite.objects.filter(author=self.user),
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_shopping_cart(self):
+        self.check_toggle(
+            f"/api/recipes/{self.recipe.pk}/shopping_cart/",
+            lambda: ShoppingCart.objects.filter(author=self.user),
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.in_carts_count, 0)
+
+    def test_subscribe(self):
+        self.check_toggle(
+            f"/api/users/{self.author.pk}/subscribe/",
+            lambda: Follow.objects.filter(user=self.user),
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_mixed_requests(self):
+        path = f"/api/recipes/{self.recipe.pk}/favorite/"
+        with ThreadPoolExecutor(max_workers=THREADS) as pool:
+            statuses = list(pool.map(
+                lambda number: self.request(
+                    "post" if number % 2 else "delete", path
+                ),
+                range(REQUESTS),
+            ))
+        self.assertLessEqual(set(statuses), {201, 204, 400}, statuses)
+        self.assertLessEqual(
+            Favorite.objects.filter(author=self.user).count(), 1
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            self.recipe.favorites_count,
+            Favorite.objects.filter(recipe=self.recipe).count(),
+        )
+
+    def test_non_numeric_id(self):
+        for method in ("post", "delete"):
+            for path in (
+                "/api/recipes/abc/favorite/",
+                "/api/recipes/abc/shopping_cart/",
+                "/api/users/abc/subscribe/",
+            ):
+                with self.subTest(method=method, path=path):
+                    self.assertEqual(self.request(method, path), 404)
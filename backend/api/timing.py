@@ -0,0 +1,176 @@
+﻿"""
+Замеры запроса: число и время SQL-запросов, самый медленный из них,
+время сериализации и общее время ответа.
+
+Включается настройкой REQUEST_TIMING. Результат уходит в заголовки
+Server-Timing (его показывают инструменты разработчика браузера) и
+X-DB-Queries и строкой JSON в лог api.timing. Выключенный
+RequestTimingMiddleware Django убирает из цепочки, а сериализаторы
+проверяют одну контекстную переменную.
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# Замеры текущего запроса; None - замеры выключены.
+_current = ContextVar("request_timing", default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+_SPACE = re.compile(r"\s+")
+# Сколько символов нормализованного SQL попадает в лог.
+SQL_PREVIEW = 300
+
+
+def normalize_sql(sql):
+    """
+    SQL без значений: литералы заменены на ?, списки параметров IN
+    свёрнуты, чтобы запросы, отличающиеся только данными, совпадали.
+    """
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PLACEHOLDERS.sub("(...)", sql.replace("%s", "?"))
+    return _SPACE.sub(" ", sql).strip()
+
+
+def fingerprint(sql):
+    """Короткий идентификатор запроса для группировки в логах."""
+    return hashlib.md5(normalize_sql(sql).encode()).hexdigest()[:12]
+
+
+def view_name(request):
+    """Класс представления и действие: RecipeViewSet.list."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None
+    view_class = getattr(match.func, "cls", None)
+    if view_class is None:
+        return match.view_name
+    action = (getattr(match.func, "actions", None) or {}).get(
+        request.method.lower()
+    )
+    return f"{view_class.__name__}.{action}" if action else view_class.__name__
+
+
+class RequestTimer:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = None
+        self.serializer_time = 0.0
+        self._serializer_depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        """Обёртка connection.execute_wrapper."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.sql_time += elapsed
+            if elapsed > self.slowest_time:
+                self.slowest_time = elapsed
+                self.slowest_sql = sql
+
+    def serialize(self, get_data):
+        """Время сериализации; вложенные сериализаторы не считаются дважды."""
+        if self._serializer_depth:
+            return get_data()
+        self._serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return get_data()
+        finally:
+            self.serializer_time += time.perf_counter() - started
+            self._serializer_depth -= 1
+
+    def server_timing(self, total):
+        return ", ".join((
+            f'db;dur={self.sql_time * 1000:.2f};desc="{self.queries} SQL"',
+            f"serializer;dur={self.serializer_time * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        ))
+
+    def as_dict(self, request, response, total):
+        slowest = None
+        if self.slowest_sql is not None:
+            slowest = {
+                "ms": round(self.slowest_time * 1000, 3),
+                "fingerprint": fingerprint(self.slowest_sql),
+                "sql": normalize_sql(self.slowest_sql)[:SQL_PREVIEW],
+            }
+        return {
+            "method": request.method,
+            "path": request.path,
+            "view": view_name(request),
+            "status": response.status_code,
+            "queries": self.queries,
+            "db_ms": round(self.sql_time * 1000, 3),
+            "serializer_ms": round(self.serializer_time * 1000, 3),
+            "total_ms": round(total * 1000, 3),
+            "slowest": slowest,
+        }
+
+
+class TimedSerializerMixin:
+    """
+    Учитывает время получения serializer.data в замерах запроса.
+    Время включает SQL-запросы, сделанные при сериализации.
+    """
+
+    @property
+    def data(self):
+        timer = _current.get()
+        if timer is None:
+            return super().data
+        return timer.serialize(lambda: super(TimedSerializerMixin, self).data)
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """list_serializer_class для many=True у замеряемых сериализаторов."""
+
+
+class RequestTimingMiddleware:
+    """Замеры каждого запроса при REQUEST_TIMING = True."""
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        token = _current.set(timer)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timer.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - timer.started
+        response["Server-Timing"] = timer.server_timing(total)
+        response["X-DB-Queries"] = str(timer.queries)
+        logger.info(json.dumps(
+            timer.as_dict(request, response, total), ensure_ascii=False
+        ))
+        return response
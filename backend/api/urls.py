@@ -1,6 +1,11 @@
 ﻿from django.urls import include, path
 from rest_framework.routers import DefaultRouter
-from .views import RecipeViewSet, IngredientViewSet, ShortLinkRedirectView
+from .views import (
+    RecipeViewSet,
+    IngredientViewSet,
+    ShortLinkRedirectView,
+    RecipeCacheStatsView,
+)
 from users.views import UserViewSet
 
 
@@ -20,4 +25,7 @@ urlpatterns = [
     path('s/<str:short_code>/', 
          ShortLinkRedirectView.as_view(), 
          name='short-link-redirect'),
+    path('cache/recipes/stats/',
+         RecipeCacheStatsView.as_view(),
+         name='recipe-cache-stats'),
 ]
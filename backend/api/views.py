@@ -1,21 +1,32 @@
-﻿from rest_framework import viewsets, generics
+﻿from datetime import timedelta
+
+from rest_framework import viewsets, generics
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import mixins
 from rest_framework.permissions import AllowAny
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
-from django.shortcuts import get_object_or_404, redirect
-from django.db.models import Exists, OuterRef
+from rest_framework.permissions import (
+    IsAdminUser, IsAuthenticated, SAFE_METHODS
+)
+from django.conf import settings
+from django.http import Http404, HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.views import View
+from django.db import transaction
+from django.db.models import Max, Sum
+from recipes import timeline
+from recipes.db import delete_returning, insert_ignore
 from recipes.models import (
     Recipe, 
     Ingredient, 
     Favorite, 
     ShoppingCart, 
-    User, 
-    ShortLink
+    User
 )
 from .serializers import (
     RecipeListSerializer,
@@ -24,15 +35,28 @@ from .serializers import (
     ShoppingCartSerializer,
     RecipeWriteSerializer,
     ShortLinkSerializer,
+    ShortLinkClicksSerializer,
 )
-from .services import shopping_cart
+from .clicks import clicks, today as clicks_today
+from .services import available_formats, shopping_cart
+from .shortlinks import short_links
+from . import cache as recipe_cache
 from .permissions import IsOwnerOrAdminOrReadOnly
 from .filters import IngredientSearchFilter, RecipeFilter
-from .paginations import ApiPagination
+from .paginations import ApiPagination, ApiCursorPagination
+from .mixins import ConditionalGetMixin
+from .search import ingredient_index
+
+# Статистика переходов по короткой ссылке: дней по умолчанию и максимум.
+LINK_STATS_DAYS = 30
+LINK_STATS_MAX_DAYS = 366
 
 
 class IngredientViewSet(
-    mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet
+    ConditionalGetMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
 ):
     """Функция для ингредиентов."""
 
@@ -41,9 +65,20 @@ class IngredientViewSet(
     permission_classes = (AllowAny,)
     filter_backends = (IngredientSearchFilter,)
     search_fields = ("^name",)
+    user_dependent = False
 
+    def get_list_version(self):
+        # Версия индекса поиска: без запроса к БД на каждое нажатие
+        # клавиши в автодополнении.
+        return ingredient_index.version
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    def get_object_version(self):
+        return Ingredient.objects.filter(pk=self.get_lookup_pk()).values(
+            "updated_at"
+        ).first()
+
+
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet Рецептов: [GET, POST, DELETE, PATCH]."""
 
     queryset = Recipe.objects.all()
@@ -52,69 +87,143 @@ class RecipeViewSet(viewsets.ModelViewSet):
     pagination_class = ApiPagination
     filterset_class = RecipeFilter
 
-    """Проверка нахождения рецепта в избранном у текущего пользователя"""
+    """
+    Автор подтягивается через JOIN, а флаги текущего пользователя
+    сериализаторы берут из множеств id (recipes.relations), загруженных
+    одним запросом. Ингредиенты догружаются одним запросом только для
+    рецептов, которых нет в кэше.
+    Количество запросов не зависит от размера страницы.
+    """
     def get_queryset(self):
-        queryset = super().get_queryset()
-        user = self.request.user
-        
-        if user.is_authenticated:
-            queryset = queryset.annotate(
-                is_favorited=Exists(
-                    Favorite.objects.filter(
-                        author=user,
-                        recipe=OuterRef('pk')
-                    )
-                )
+        return super().get_queryset().select_related("author")
+
+    def get_list_version(self):
+        """
+        Версия запрошенной страницы: id и updated_at её рецептов и их
+        авторов - один запрос с LIMIT по тому же порядку, что и у
+        страницы. Правки ингредиентов меняют updated_at рецептов
+        (api/signals.py). Лишняя строка за страницей ловит появление и
+        исчезновение следующей страницы; общее число рецептов (count)
+        в ответе 304 может отставать, пока не изменится сама страница.
+        """
+        if ApiCursorPagination.is_requested(self.request):
+            # ETag считается только для страниц с номером.
+            return None
+        paginator = self.paginator
+        try:
+            number = int(
+                self.request.query_params.get(paginator.page_query_param, 1)
+            )
+        except ValueError:
+            return None
+        if number < 1:
+            return None
+        size = paginator.get_page_size(self.request)
+        offset = (number - 1) * size
+        rows = list(
+            self.filter_queryset(self.get_queryset())[
+                offset:offset + size + 1
+            ].values_list("id", "updated_at", "author__updated_at")
+        )
+        return {
+            "rows": rows,
+            "updated_at": max(
+                (max(row[1:]) for row in rows), default=None
+            ),
+        }
+
+    def get_object_version(self):
+        return Recipe.objects.filter(pk=self.get_lookup_pk()).annotate(
+            ingredients_updated_at=Max(
+                "recipe_ingredients__ingredient__updated_at"
             )
-        return queryset
+        ).values(
+            "updated_at", "author__updated_at", "ingredients_updated_at"
+        ).first()
+
+    def perform_content_negotiation(self, request, force=False):
+        # В download_shopping_cart ?format= выбирает формат файла,
+        # а не рендерер DRF.
+        return super().perform_content_negotiation(
+            request, force=force or self.action == "download_shopping_cart"
+        )
+
+    @property
+    def paginator(self):
+        """
+        Курсорная пагинация для бесконечной ленты - по запросу клиента,
+        для ленты подписок - всегда.
+        """
+        if not hasattr(self, "_paginator"):
+            if (
+                self.action == "feed"
+                or ApiCursorPagination.is_requested(self.request)
+            ):
+                self._paginator = ApiCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeListSerializer
         return RecipeWriteSerializer
 
-    @action(
-        detail=True,
-        methods=["post", "delete"],
-        permission_classes=[IsAuthenticated],
-        url_path="favorite",
-    )
-    def favorite(self, request, pk=None):
-        """Управление списком избранных рецептов."""
+    def _toggle_recipe(self, request, pk, model, serializer_class, messages):
+        """
+        Добавление/удаление рецепта в избранное или корзину.
+        Запись - один INSERT ... ON CONFLICT DO NOTHING или
+        DELETE ... RETURNING, поэтому повторные запросы не дают 500.
+        """
         user = request.user
-
-        try:
-            recipe = Recipe.objects.get(pk=pk)
-        except Recipe.DoesNotExist:
-            return Response(
-                {"errors": "Рецепта не существует"},
-                status=status.HTTP_404_NOT_FOUND,
-            )   
+        pk = self.get_lookup_pk()
 
         if request.method == "POST":
-            if user.favorite.filter(recipe=recipe).exists():
+            recipe = Recipe.objects.filter(pk=pk).first()
+            if recipe is None:
+                return Response(
+                    {"errors": "Рецепта не существует"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            if insert_ignore(model, author=user, recipe=recipe) is None:
                 return Response(
-                    {"errors": "Рецепт уже в избранном!"},
+                    {"errors": messages["exists"]},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-        
-            user.favorite.create(recipe=recipe)
-            serializer = FavoriteSerializer(
+            serializer = serializer_class(
                 recipe, context={"request": request}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        favorite_item = user.favorite.filter(recipe=recipe).first()
-        if not favorite_item:
+        if delete_returning(model, author=user, recipe_id=pk):
             return Response(
-                {"errors": "Этого рецепта нет в избранном"},
-                status=status.HTTP_400_BAD_REQUEST,
+                messages["deleted"], status=status.HTTP_204_NO_CONTENT
+            )
+        if not Recipe.objects.filter(pk=pk).exists():
+            return Response(
+                {"errors": "Рецепта не существует"},
+                status=status.HTTP_404_NOT_FOUND,
             )
-
-        favorite_item.delete()
         return Response(
-            {"message": "Рецепт успешно удалён из избранного"},
-            status=status.HTTP_204_NO_CONTENT, 
+            {"errors": messages["missing"]},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    @action(
+        detail=True,
+        methods=["post", "delete"],
+        permission_classes=[IsAuthenticated],
+        url_path="favorite",
+    )
+    @transaction.atomic
+    def favorite(self, request, pk=None):
+        """Управление списком избранных рецептов."""
+        return self._toggle_recipe(
+            request, pk, Favorite, FavoriteSerializer, {
+                "exists": "Рецепт уже в избранном!",
+                "missing": "Этого рецепта нет в избранном",
+                "deleted": {"message": "Рецепт успешно удалён из избранного"},
+            }
         )
 
     @action(
@@ -122,66 +231,135 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=["post", "delete"],
         permission_classes=[IsAuthenticated],
     )
+    @transaction.atomic
     def shopping_cart(self, request, **kwargs):
         """Управление списком покупок."""
-        recipe_id = kwargs.get("pk")
-        user = request.user
-
-        if not Recipe.objects.filter(id=recipe_id).exists():
-            return Response(
-                {"errors": "Рецепта не существует"},
-                status=status.HTTP_404_NOT_FOUND,
-            )
-
-        recipe = Recipe.objects.get(id=recipe_id)
-
-        if request.method == "POST":
-            if user.shopping_cart.filter(recipe=recipe).exists():
-                return Response(
-                    {"errors": "Рецепт уже добавлен!"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            user.shopping_cart.create(recipe=recipe)
-            serializer = ShoppingCartSerializer(
-                recipe, context={"request": request}
-            )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self._toggle_recipe(
+            request, kwargs.get("pk"), ShoppingCart, ShoppingCartSerializer, {
+                "exists": "Рецепт уже добавлен!",
+                "missing": "Этого рецепта в корзине нет",
+                "deleted": "Рецепт успешно удалён из списка покупок.",
+            }
+        )
 
-        cart_item = user.shopping_cart.filter(recipe=recipe).first()
-        if not cart_item:
-            return Response(
-                {"errors": "Этого рецепта в корзине нет"},
-                status=status.HTTP_400_BAD_REQUEST,
+    @action(
+        detail=False, methods=["get"], permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь.
+        Страница собирается из ограниченных курсором выборок его ленты
+        (TimelineEntry) и рецептов популярных авторов, а не из всей
+        ленты целиком.
+        """
+        paginator = self.paginator
+        cursor = paginator.decode_cursor(request)
+        limit = paginator.get_page_size(request) + 1
+        position, ascending = None, False
+        if cursor is not None:
+            limit += cursor.offset
+            ascending = cursor.reverse
+            if cursor.position is not None:
+                try:
+                    position = int(cursor.position)
+                except ValueError:
+                    raise NotFound(paginator.invalid_cursor_message)
+        queryset = self.get_queryset().filter(
+            pk__in=timeline.feed_recipe_ids(
+                request.user, limit, position, ascending
             )
-
-        cart_item.delete()
-        return Response(
-            "Рецепт успешно удалён из списка покупок.",
-            status=status.HTTP_204_NO_CONTENT,
         )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(
         detail=False, methods=["get"], permission_classes=[IsAuthenticated]
     )
     def download_shopping_cart(self, request):
         """Скачивание списка покупок."""
+        file_format = request.query_params.get("format", "txt")
+        formats = available_formats()
+        if file_format not in formats:
+            return Response(
+                {"errors": f"Доступные форматы: {', '.join(formats)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         if not request.user.shopping_cart.exists():
             return Response(
                 "Список покупок пуст.", status=status.HTTP_404_NOT_FOUND
             )
-        return shopping_cart(self, request, request.user)
+        return shopping_cart(self, request, request.user, file_format)
 
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_short_link(self, request, pk=None):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        short_link, created = ShortLink.objects.get_or_create(
-            recipe=recipe,
-            destination = f'/recipes/{pk}/'
-        )
-        serializer = ShortLinkSerializer(short_link, context={'request': request})
+        recipe = get_object_or_404(Recipe.objects.only("pk"), pk=pk)
+        serializer = ShortLinkSerializer(recipe, context={'request': request})
         return Response(serializer.data)
 
-class ShortLinkRedirectView(APIView):
+    @action(
+        detail=True,
+        methods=["get"],
+        permission_classes=[IsAuthenticated],
+        url_path="link-stats",
+    )
+    def link_stats(self, request, pk=None):
+        """
+        Переходы по короткой ссылке рецепта: всего и по дням за последние
+        ?days= дней. Доступно автору рецепта и администраторам.
+        Счётчики пишутся пачками, последние секунды могут не войти.
+        """
+        recipe = get_object_or_404(Recipe.objects.only("author_id"), pk=pk)
+        if recipe.author_id != request.user.pk and not request.user.is_staff:
+            return Response(
+                {"errors": "Статистика доступна только автору рецепта."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        try:
+            days = int(request.query_params.get("days", LINK_STATS_DAYS))
+        except ValueError:
+            days = LINK_STATS_DAYS
+        days = min(max(days, 1), LINK_STATS_MAX_DAYS)
+        queryset = recipe.link_clicks.all()
+        total = queryset.aggregate(total=Sum("clicks"))["total"] or 0
+        since = clicks_today() - timedelta(days=days - 1)
+        serializer = ShortLinkClicksSerializer(
+            queryset.filter(date__gte=since), many=True
+        )
+        return Response({"total": total, "days": serializer.data})
+
+
+class ShortLinkRedirectView(View):
+    """
+    Переход по короткой ссылке - обычный Django View без механики DRF
+    (согласование формата, аутентификация, троттлинг). Адрес берётся
+    из кэша процесса. Переходы считаются, поэтому ответ - временный
+    редирект, который браузеры и CDN не отдают из кэша повторно
+    (private, max-age=SHORT_LINK_MAX_AGE, по умолчанию 0).
+    """
+
+    http_method_names = ["get", "head"]
+    click_buffer = clicks
+
     def get(self, request, short_code):
-        short_link = get_object_or_404(ShortLink, short_code=short_code)
-        return redirect(short_link.destination)
\ No newline at end of file
+        link = short_links.resolve(short_code)
+        if link is None:
+            raise Http404("Короткая ссылка не найдена.")
+        recipe_id, destination = link
+        if request.method == "GET":
+            # HEAD присылают проверщики ссылок, а не читатели.
+            self.click_buffer.record(recipe_id)
+        response = HttpResponseRedirect(destination)
+        patch_cache_control(
+            response, private=True, max_age=settings.SHORT_LINK_MAX_AGE
+        )
+        return response
+
+
+class RecipeCacheStatsView(APIView):
+    """Статистика попаданий в кэш рецептов для мониторинга."""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(recipe_cache.stats.as_dict())
@@ -39,6 +39,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.timing.RequestTimingMiddleware",
+    "api.profiling.RequestProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -74,6 +76,12 @@ if DEBUG:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": "db.sqlite3",
+            # Запись берёт блокировку в начале транзакции, иначе
+            # параллельные запросы получают "database is locked".
+            "OPTIONS": {"transaction_mode": "IMMEDIATE"},
+            # Тестовая БД в файле: общая БД в памяти блокирует таблицы
+            # без ожидания, и тесты с потоками получают "table is locked".
+            "TEST": {"NAME": "test_db.sqlite3"},
         }
     }
 else:
@@ -88,6 +96,118 @@ else:
         }
     }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "foodgram",
+    },
+    # LocMemCache вытесняет давно неиспользуемые записи (LRU)
+    # при превышении MAX_ENTRIES и по истечении TIMEOUT. Ключи содержат
+    # updated_at из БД (api/cache.py), поэтому кэш каждого процесса не
+    # отдаёт устаревших рецептов; общий бэкенд (Redis, Memcached) лишь
+    # экономит промахи.
+    "recipes": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "foodgram-recipes",
+        "TIMEOUT": int(os.getenv("RECIPE_CACHE_TIMEOUT", 600)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("RECIPE_CACHE_MAX_ENTRIES", 10000)),
+        },
+    },
+    # Кэш token -> user_id для CachedTokenAuthentication. Записи сверяются
+    # с updated_at пользователя в БД, поэтому подходит и кэш процесса.
+    "auth": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "foodgram-auth",
+        "TIMEOUT": int(os.getenv("AUTH_TOKEN_CACHE_TIMEOUT", 300)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(
+                os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", 10000)
+            ),
+        },
+    },
+}
+
+RECIPE_CACHE_ALIAS = "recipes"
+AUTH_TOKEN_CACHE_ALIAS = "auth"
+
+# Индекс автодополнения ингредиентов: как часто (сек) сверять его с
+# версией каталога в БД и лимит выдачи.
+INGREDIENT_INDEX_CHECK_INTERVAL = int(
+    os.getenv("INGREDIENT_INDEX_CHECK_INTERVAL", 5)
+)
+INGREDIENT_SEARCH_LIMIT = int(os.getenv("INGREDIENT_SEARCH_LIMIT", 100))
+
+# Лента подписок: длина ленты пользователя и порог подписчиков, начиная
+# с которого рецепты автора не раскладываются по лентам, а читаются
+# при запросе.
+TIMELINE_MAX_LENGTH = int(os.getenv("TIMELINE_MAX_LENGTH", 500))
+TIMELINE_CELEBRITY_FOLLOWERS = int(
+    os.getenv("TIMELINE_CELEBRITY_FOLLOWERS", 1000)
+)
+
+# Загрузка картинок: предельный объём и наибольшая сторона. Уменьшенные
+# копии готовят IMAGE_VARIANTS_WORKERS фоновых потоков (0 - сразу после
+# коммита, в том же потоке).
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.getenv("IMAGE_UPLOAD_MAX_BYTES", 5 * 1024 * 1024)
+)
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", 4096))
+IMAGE_VARIANTS_WORKERS = int(os.getenv("IMAGE_VARIANTS_WORKERS", 2))
+
+# Короткие ссылки: размер LRU в процессе, время жизни записей (сек) для
+# известных и неизвестных кодов, max-age редиректа. Переход из кэша
+# браузера не попадает в статистику, поэтому по умолчанию 0.
+SHORT_LINK_CACHE_SIZE = int(os.getenv("SHORT_LINK_CACHE_SIZE", 50000))
+SHORT_LINK_CACHE_TTL = int(os.getenv("SHORT_LINK_CACHE_TTL", 3600))
+SHORT_LINK_NEGATIVE_TTL = int(os.getenv("SHORT_LINK_NEGATIVE_TTL", 30))
+SHORT_LINK_MAX_AGE = int(os.getenv("SHORT_LINK_MAX_AGE", 0))
+# Переходы по ним копятся в памяти и пишутся в БД раз в интервал (сек)
+# или при накоплении заданного числа переходов.
+SHORT_LINK_CLICKS_FLUSH_INTERVAL = int(
+    os.getenv("SHORT_LINK_CLICKS_FLUSH_INTERVAL", 10)
+)
+SHORT_LINK_CLICKS_BUFFER_SIZE = int(
+    os.getenv("SHORT_LINK_CLICKS_BUFFER_SIZE", 1000)
+)
+# Ключ перестановки, из которой получаются коды рецептов: после смены
+# ключа выданные коды перестают работать.
+SHORT_CODE_KEY = os.getenv("SHORT_CODE_KEY", SECRET_KEY)
+
+# Замеры запросов (api/timing.py): заголовки Server-Timing и
+# X-DB-Queries и строка JSON в лог api.timing на каждый запрос.
+REQUEST_TIMING = os.getenv("REQUEST_TIMING", "0") == "1"
+
+# Профилирование запросов (api/profiling.py): доля случайных запросов
+# (0 - только запросы администратора с X-Profile: 1 или ?profile=1) и
+# каталог, где хранятся последние PROFILING_MAX_FILES профилей.
+PROFILING = os.getenv("PROFILING", "0") == "1"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+PROFILING_DIR = os.getenv(
+    "PROFILING_DIR", os.path.join(BASE_DIR, "profiles")
+)
+PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", 200))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "api.timing": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
+
+# TTF-шрифт с кириллицей для PDF-списка покупок.
+SHOPPING_LIST_FONT = os.getenv(
+    "SHOPPING_LIST_FONT", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -122,12 +242,25 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Медиафайлы хранятся по хешу содержимого (recipes/storage.py).
+STORAGES = {
+    "default": {
+        "BACKEND": "recipes.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+# Файлы без ссылок моложе этого срока (часов) gc_media не трогает:
+# их запись в БД может быть ещё не зафиксирована.
+MEDIA_GC_GRACE_HOURS = int(os.getenv("MEDIA_GC_GRACE_HOURS", 24))
+
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ],
 }
 
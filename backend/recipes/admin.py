@@ -1,5 +1,4 @@
 ﻿from django.contrib import admin
-from django.db.models import Count
 from .models import (
     Favorite,
     Follow,
@@ -7,7 +6,9 @@ from .models import (
     IngredientRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
 )
+from . import shopping_list
 
 
 class IngredientsInline(admin.TabularInline):
@@ -69,23 +70,26 @@ class RecipeAdmin(admin.ModelAdmin):
     Админка рецептов.
     """
 
-    list_display = ("id", "author", "name", "pub_date", "in_favorite")
+    list_display = (
+        "id", "author", "name", "pub_date", "in_favorite", "in_carts_count"
+    )
     search_fields = ("name", "author__username")
     list_filter = ("pub_date", "author")
     empty_value_display = "-пусто-"
     inlines = [IngredientsInline]
     list_select_related = ("author",)
 
+    def save_related(self, request, form, formsets, change):
+        """Переносит изменения состава рецепта в списки покупок."""
+        if not change:
+            return super().save_related(request, form, formsets, change)
+        old_amounts = shopping_list.recipe_amounts(form.instance.pk)
+        super().save_related(request, form, formsets, change)
+        shopping_list.recipe_changed(form.instance.pk, old_amounts)
+
     """
     Просмотр кол-ва добавленных рецептов в избранное
     """
-    def get_queryset(self, request):
-        return (
-            super()
-            .get_queryset(request)
-            .annotate(favorites_count=Count("favorite"))
-        )
-
     def in_favorite(self, obj):
         return obj.favorites_count
 
@@ -93,6 +97,16 @@ class RecipeAdmin(admin.ModelAdmin):
     in_favorite.admin_order_field = "favorites_count"
 
 
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """
+    Админка итогов списков покупок.
+    """
+
+    list_display = ("user", "ingredient", "total_amount")
+    list_filter = ("user",)
+    list_select_related = ("user", "ingredient")
+
+
 class IngredientAdmin(admin.ModelAdmin):
     """
     Админка ингридиентов.
@@ -109,3 +123,4 @@ admin.site.register(IngredientRecipe, IngredientRecipeAdmin)
 admin.site.register(Follow, SubscrationAdmin)
 admin.site.register(Favorite, FavoriteAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
+admin.site.register(ShoppingListItem, ShoppingListItemAdmin)
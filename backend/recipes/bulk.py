@@ -0,0 +1,154 @@
+﻿"""
+Массовая загрузка данных: общие части команд load_* и generate_dataset.
+
+Строки пишутся пачками через bulk_create в одной транзакции, поэтому
+сигналы не срабатывают - счётчики и ленты команды пересчитывают сами.
+Пароли хешируются в пуле процессов (PBKDF2 занимает процессор, и потоки
+упёрлись бы в GIL), файлы копируются в пуле потоков.
+"""
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.db import connections
+from users.models import User
+from . import counters, timeline
+from .models import IngredientRecipe, Recipe
+
+BATCH_SIZE = 1000
+IMAGE_WORKERS = 8
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Progress:
+    """Печатает число обработанных строк и скорость."""
+
+    def __init__(self, stdout, label, total=None):
+        self.stdout = stdout
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return max(time.perf_counter() - self.started, 1e-9)
+
+    def add(self, count):
+        self.done += count
+        total = f"/{self.total}" if self.total else ""
+        self.stdout.write(
+            f"{self.label}: {self.done}{total} "
+            f"({self.done / self.elapsed:.0f} строк/с)"
+        )
+
+    def summary(self):
+        return (
+            f"{self.label}: {self.done} за {self.elapsed:.2f} с, "
+            f"{self.done / self.elapsed:.0f} строк/с"
+        )
+
+
+def _setup_worker():
+    # При старте процессов через spawn (macOS, Windows) Django
+    # в них ещё не настроен.
+    from django.apps import apps
+
+    if not apps.ready:
+        import django
+
+        django.setup()
+
+
+def hash_passwords(passwords, workers=None):
+    """Хеши паролей в том же порядке; workers=1 - без пула процессов."""
+    passwords = list(passwords)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_setup_worker
+    ) as pool:
+        return list(pool.map(
+            make_password,
+            passwords,
+            chunksize=max(1, len(passwords) // (workers * 4)),
+        ))
+
+
+def copy_files(field, paths, workers=IMAGE_WORKERS):
+    """
+    Сохраняет файлы в хранилище поля модели и возвращает
+    {путь: имя в хранилище}. Каждый файл копируется один раз, сколько бы
+    записей на него ни ссылалось; у хранилища с учётом ссылок
+    (recipes/storage.py) счётчик увеличивается на число ссылок.
+    """
+    storage = field.storage
+    uses = Counter(paths)
+
+    def copy(path):
+        try:
+            with open(path, "rb") as source:
+                return storage.save(
+                    field.generate_filename(None, os.path.basename(path)),
+                    File(source),
+                )
+        finally:
+            # Соединение с БД этого потока (его открывает хранилище).
+            connections.close_all()
+
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="bulk-copy"
+    ) as pool:
+        names = dict(zip(uses, pool.map(copy, uses)))
+    add_references = getattr(storage, "add_references", None)
+    if add_references is not None:
+        for path, count in uses.items():
+            if count > 1:
+                add_references(names[path], count - 1)
+    return names
+
+
+def create_recipes(rows, batch_size=BATCH_SIZE, progress=None):
+    """
+    Пишет рецепты и их состав пачками. rows - пары (несохранённый Recipe,
+    {id ингредиента: количество}). Вызывается внутри транзакции; id
+    рецептов бэкенд возвращает из INSERT (PostgreSQL, SQLite 3.35+).
+    """
+    for batch in batches(rows, batch_size):
+        Recipe.objects.bulk_create([recipe for recipe, _ in batch])
+        IngredientRecipe.objects.bulk_create(
+            [
+                IngredientRecipe(
+                    recipe_id=recipe.pk,
+                    ingredient_id=ingredient_id,
+                    amount=amount,
+                )
+                for recipe, amounts in batch
+                for ingredient_id, amount in amounts.items()
+            ],
+            batch_size=batch_size,
+        )
+        if progress is not None:
+            progress.add(len(batch))
+
+
+def refresh_authors(author_ids):
+    """
+    То, что при обычном сохранении рецепта делают сигналы и сериализатор:
+    счётчик рецептов авторов и ленты их подписчиков. author_ids - список
+    или подзапрос.
+    """
+    User.objects.filter(pk__in=author_ids).update(
+        recipes_count=counters.actual_count(Recipe, "author_id")
+    )
+    timeline.push_authors(author_ids)
@@ -0,0 +1,50 @@
+﻿"""
+Денормализованные счётчики рецептов и пользователей.
+
+Счётчики меняются одним UPDATE с F-выражением в сигналах на создание и
+удаление записей; команда recount_counters пересчитывает их целиком.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from users.models import User
+from .models import Favorite, Follow, Recipe, ShoppingCart
+
+# Модель-источник: (модель со счётчиком, поле внешнего ключа, счётчик).
+COUNTERS = {
+    Favorite: (Recipe, "recipe_id", "favorites_count"),
+    ShoppingCart: (Recipe, "recipe_id", "in_carts_count"),
+    Recipe: (User, "author_id", "recipes_count"),
+    Follow: (User, "author_id", "followers_count"),
+}
+
+
+def change_counter(instance, delta):
+    model, fk_field, counter = COUNTERS[type(instance)]
+    model.objects.filter(pk=getattr(instance, fk_field)).update(
+        **{counter: Greatest(F(counter) + delta, 0)}
+    )
+
+
+def actual_count(source, fk_field):
+    """Подзапрос с фактическим количеством записей source на объект."""
+    return Coalesce(
+        Subquery(
+            source.objects.filter(**{fk_field: OuterRef("pk")})
+            .order_by()
+            .values(fk_field)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def recount(source):
+    """Пересчитывает счётчик целиком, возвращает число расхождений."""
+    model, fk_field, counter = COUNTERS[source]
+    actual = actual_count(source, fk_field)
+    drifted = model.objects.annotate(actual=actual).exclude(
+        **{counter: F("actual")}
+    ).count()
+    model.objects.update(**{counter: actual})
+    return drifted
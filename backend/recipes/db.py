@@ -0,0 +1,124 @@
+﻿"""
+Однозапросные операции записи для связей пользователь-рецепт/автор
+и пакетного увеличения счётчиков.
+
+INSERT ... ON CONFLICT DO NOTHING RETURNING и DELETE ... RETURNING
+поддерживаются и SQLite (3.35+), и PostgreSQL. Повторный запрос на ту же
+пару не падает с IntegrityError, а просто ничего не меняет. Сигналы
+post_save/pre_delete/post_delete отправляются так же, как при обычных
+save() и delete(), чтобы счётчики и списки покупок оставались верными.
+delete_returning отправляет pre_delete, когда строки уже нет: обработчики
+могут опираться только на значения полей экземпляра, но не на наличие
+записи в БД (и не должны её перечитывать или блокировать).
+"""
+from django.db import connections, router
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+
+def _columns(model, names):
+    return [model._meta.get_field(name) for name in names]
+
+
+def insert_ignore(model, **values):
+    """Создаёт запись или возвращает None, если такая уже есть."""
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    opts = model._meta
+    instance = model(**values)
+    fields = _columns(model, values)
+    sql = (
+        "INSERT INTO {} ({}) VALUES ({}) "
+        "ON CONFLICT DO NOTHING RETURNING {}"
+    ).format(
+        qn(opts.db_table),
+        ", ".join(qn(field.column) for field in fields),
+        ", ".join(["%s"] * len(fields)),
+        qn(opts.pk.column),
+    )
+    params = [
+        field.get_db_prep_save(getattr(instance, field.attname), connection)
+        for field in fields
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    instance.pk = row[0]
+    instance._state.adding = False
+    instance._state.db = using
+    post_save.send(
+        sender=model, instance=instance, created=True,
+        update_fields=None, raw=False, using=using,
+    )
+    return instance
+
+
+def delete_returning(model, **filters):
+    """Удаляет записи по точному совпадению полей, возвращает их число."""
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    opts = model._meta
+    fields = _columns(model, filters)
+    probe = model(**filters)
+    sql = "DELETE FROM {} WHERE {} RETURNING {}".format(
+        qn(opts.db_table),
+        " AND ".join(f"{qn(field.column)} = %s" for field in fields),
+        qn(opts.pk.column),
+    )
+    params = [
+        field.get_db_prep_value(getattr(probe, field.attname), connection)
+        for field in fields
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    for (pk,) in rows:
+        instance = model(pk=pk, **filters)
+        instance._state.adding = False
+        instance._state.db = using
+        # pre_delete - уже после удаления строки (см. описание модуля):
+        # обработчику списка покупок нужны только author_id и recipe_id.
+        for signal in (pre_delete, post_delete):
+            signal.send(
+                sender=model, instance=instance, using=using, origin=instance
+            )
+    return len(rows)
+
+
+def upsert_increment(model, key_fields, counter, rows):
+    """
+    Прибавляет значения к счётчику одной пачкой:
+    INSERT ... ON CONFLICT (ключ) DO UPDATE SET счётчик = счётчик + новое.
+    rows - {(значения ключевых полей): прибавка}. Сигналы не отправляются.
+    """
+    if not rows:
+        return
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    fields = _columns(model, [*key_fields, counter])
+    column = qn(fields[-1].column)
+    sql = (
+        "INSERT INTO {table} ({columns}) VALUES ({values}) "
+        "ON CONFLICT ({keys}) DO UPDATE "
+        "SET {column} = {table}.{column} + EXCLUDED.{column}"
+    ).format(
+        table=table,
+        columns=", ".join(qn(field.column) for field in fields),
+        values=", ".join(["%s"] * len(fields)),
+        keys=", ".join(qn(field.column) for field in fields[:-1]),
+        column=column,
+    )
+    params = [
+        [
+            field.get_db_prep_save(value, connection)
+            for field, value in zip(fields, (*key, delta))
+        ]
+        for key, delta in rows.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
@@ -0,0 +1,164 @@
+﻿"""
+Уменьшенные копии картинок рецептов и аватаров.
+
+После сохранения модели с новой картинкой её копии (JPEG и WebP для
+каждого размера из VARIANTS) готовятся в фоновом потоке, так что запрос
+на загрузку не ждёт ресайза. Исходник декодируется один раз на все копии.
+Пути к готовым копиям записываются в JSON-поле модели вместе с именем
+исходника ("source"): пока оно не совпадает с текущей картинкой, копии
+считаются неготовыми и не отдаются клиентам.
+Команда generate_image_variants готовит недостающие копии.
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Название: наибольшая сторона в пикселях.
+VARIANTS = {
+    "small": 160,
+    "medium": 480,
+    "large": 960,
+}
+# Формат: (формат Pillow, расширение, параметры сохранения).
+FORMATS = {
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True}),
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+}
+SOURCE_KEY = "source"
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANTS_WORKERS,
+            thread_name_prefix="image-variants",
+        )
+    return _executor
+
+
+def is_ready(fieldfile, variants):
+    return bool(fieldfile) and variants.get(SOURCE_KEY) == fieldfile.name
+
+
+def variant_urls(fieldfile, variants):
+    """{размер: {формат: url}} готовых копий или пустой словарь."""
+    if not is_ready(fieldfile, variants):
+        return {}
+    storage = fieldfile.storage
+    return {
+        size: {fmt: storage.url(name) for fmt, name in files.items()}
+        for size, files in variants.items()
+        if size != SOURCE_KEY
+    }
+
+
+def absolute_urls(request, urls):
+    """Те же ссылки на копии, но абсолютные - как у поля image."""
+    if request is None:
+        return urls
+    return {
+        size: {fmt: request.build_absolute_uri(url) for fmt, url in
+               files.items()}
+        for size, files in urls.items()
+    }
+
+
+def _variant_name(source, size, extension):
+    directory, filename = os.path.split(source)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, "variants", f"{stem}_{size}.{extension}")
+
+
+def render_variants(fieldfile):
+    """Декодирует картинку один раз и сохраняет все копии в хранилище."""
+    storage = fieldfile.storage
+    with fieldfile.open("rb") as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image = image.convert("RGB")
+    variants = {SOURCE_KEY: fieldfile.name}
+    for size, side in VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((side, side), Image.Resampling.LANCZOS)
+        variants[size] = {}
+        for fmt, (pil_format, extension, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, **options)
+            name = _variant_name(fieldfile.name, size, extension)
+            storage.delete(name)
+            variants[size][fmt] = storage.save(
+                name, ContentFile(buffer.getvalue())
+            )
+    return variants
+
+
+def _delete_variants(storage, variants):
+    for size, files in variants.items():
+        if size != SOURCE_KEY:
+            for name in files.values():
+                storage.delete(name)
+
+
+def process(model, pk, field_name, variants_field):
+    """Готовит копии и записывает их в модель, если картинка не менялась."""
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    fieldfile = getattr(instance, field_name)
+    old_variants = getattr(instance, variants_field)
+    if not fieldfile or is_ready(fieldfile, old_variants):
+        return
+    variants = render_variants(fieldfile)
+    with transaction.atomic():
+        current = model.objects.select_for_update().filter(pk=pk).first()
+        if current is None or getattr(current, field_name) != fieldfile.name:
+            # Картинку успели заменить - её копиями займётся другая задача.
+            _delete_variants(fieldfile.storage, variants)
+            return
+        setattr(current, variants_field, variants)
+        # save(), а не update(): сигналы сбрасывают кэши, а updated_at
+        # меняет ETag ответа.
+        current.save(update_fields=[variants_field, "updated_at"])
+    _delete_variants(fieldfile.storage, old_variants)
+
+
+def _run(model, pk, field_name, variants_field):
+    try:
+        process(model, pk, field_name, variants_field)
+    except Exception:
+        logger.exception(
+            "Не удалось подготовить копии %s.%s #%s",
+            model.__name__, field_name, pk,
+        )
+
+
+def _run_in_worker(*args):
+    try:
+        _run(*args)
+    finally:
+        close_old_connections()
+
+
+def schedule(instance, field_name, variants_field):
+    """Ставит подготовку копий в очередь, если картинка изменилась."""
+    fieldfile = getattr(instance, field_name)
+    if not fieldfile or is_ready(fieldfile, getattr(instance, variants_field)):
+        return
+    args = (type(instance), instance.pk, field_name, variants_field)
+    if not settings.IMAGE_VARIANTS_WORKERS:
+        # Без фоновых потоков (разработка, команды) - сразу после коммита.
+        transaction.on_commit(lambda: _run(*args))
+        return
+    transaction.on_commit(
+        lambda: _get_executor().submit(_run_in_worker, *args)
+    )
@@ -0,0 +1,58 @@
+﻿from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import ShoppingListItem
+from recipes.shopping_list import expected_totals
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет итоги списков покупок с корзинами и пересобирает "
+        "таблицу с нуля."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать расхождения, ничего не менять",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = expected_totals()
+            actual = {
+                (user_id, ingredient_id): total
+                for user_id, ingredient_id, total
+                in ShoppingListItem.objects.values_list(
+                    "user_id", "ingredient_id", "total_amount"
+                ).iterator()
+            }
+            missing = expected.keys() - actual.keys()
+            extra = actual.keys() - expected.keys()
+            wrong = [
+                key for key in expected.keys() & actual.keys()
+                if expected[key] != actual[key]
+            ]
+            self.stdout.write(
+                f"Отсутствуют: {len(missing)}, лишние: {len(extra)}, "
+                f"неверные суммы: {len(wrong)}"
+            )
+            if options["dry_run"]:
+                return
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        total_amount=total,
+                    )
+                    for (user_id, ingredient_id), total in expected.items()
+                ),
+                batch_size=BATCH_SIZE,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Списки покупок пересобраны: {len(expected)} позиций."
+        ))
@@ -0,0 +1,115 @@
+﻿import os
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from recipes.models import MediaBlob, Recipe
+from users.models import User
+
+# Модель: (поле файла, JSON-поле с уменьшенными копиями).
+MEDIA_FIELDS = {
+    Recipe: ("image", "image_variants"),
+    User: ("avatar", "avatar_variants"),
+}
+
+
+def referenced_names():
+    """Сколько раз каждый файл упоминается в записях БД."""
+    references = Counter()
+    for model, (field_name, variants_field) in MEDIA_FIELDS.items():
+        rows = model.objects.exclude(
+            **{f"{field_name}__in": ("", None)}
+        ).values_list(field_name, variants_field)
+        for name, variants in rows.iterator():
+            references[name] += 1
+            for size, files in variants.items():
+                if isinstance(files, dict):
+                    references.update(files.values())
+    return references
+
+
+def media_files():
+    """Пути всех файлов в каталогах upload_to медиаполей."""
+    for model, (field_name, _) in MEDIA_FIELDS.items():
+        upload_to = model._meta.get_field(field_name).upload_to
+        root = default_storage.path(upload_to)
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                full_path = os.path.join(directory, filename)
+                yield os.path.relpath(
+                    full_path, default_storage.location
+                ).replace(os.sep, "/"), full_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает ссылки на медиафайлы и удаляет файлы, на которые "
+        "не ссылается ни одна запись."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, что будет удалено",
+        )
+        parser.add_argument(
+            "--grace-hours",
+            type=int,
+            default=settings.MEDIA_GC_GRACE_HOURS,
+            help="Не трогать файлы моложе этого срока",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        cutoff = timezone.now() - timedelta(hours=options["grace_hours"])
+        references = referenced_names()
+
+        fixed = 0
+        for blob in MediaBlob.objects.iterator():
+            actual = references.get(blob.name, 0)
+            if blob.refcount != actual:
+                fixed += 1
+                if not dry_run:
+                    MediaBlob.objects.filter(pk=blob.pk).update(
+                        refcount=actual
+                    )
+
+        # Обычное delete() у этого хранилища только снимает ссылку.
+        delete_file = getattr(
+            default_storage, "delete_blob", default_storage.delete
+        )
+        removed = freed = 0
+        on_disk = set()
+        for name, full_path in media_files():
+            on_disk.add(name)
+            if name in references:
+                continue
+            modified = default_storage.get_modified_time(name)
+            blob = MediaBlob.objects.filter(name=name).first()
+            if modified > cutoff or (blob and blob.updated_at > cutoff):
+                continue
+            removed += 1
+            freed += os.path.getsize(full_path)
+            if not dry_run:
+                # Строку удаляем только если на файл так и не сослались.
+                if blob is None or MediaBlob.objects.filter(
+                    pk=blob.pk, refcount__lte=0, updated_at__lte=cutoff
+                ).delete()[0]:
+                    delete_file(name)
+
+        # Записи о файлах, которых уже нет на диске.
+        stale = MediaBlob.objects.filter(
+            refcount__lte=0, updated_at__lte=cutoff
+        ).exclude(name__in=on_disk)
+        if not dry_run:
+            stale.delete()
+
+        action = "Будет удалено" if dry_run else "Удалено"
+        self.stdout.write(
+            f"Исправлено счётчиков ссылок: {fixed}. "
+            f"{action} файлов: {removed} ({freed // 1024} КБ)."
+        )
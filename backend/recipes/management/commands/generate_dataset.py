@@ -0,0 +1,279 @@
+﻿import math
+import os
+import random
+import tempfile
+from collections import Counter
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image, ImageDraw
+from recipes.bulk import (
+    BATCH_SIZE,
+    IMAGE_WORKERS,
+    Progress,
+    batches,
+    copy_files,
+    create_recipes,
+    refresh_authors,
+)
+from recipes.models import Favorite, Follow, Ingredient, Recipe, ShoppingCart
+from users.models import User
+
+WORDS = (
+    "нарезать смешать обжарить запечь посолить поперчить добавить "
+    "варить тушить подавать горячим охладить взбить посыпать зеленью "
+    "на медленном огне до золотистой корочки по вкусу"
+).split()
+# Показатель степенного закона популярности: авторов, рецептов и
+# ингредиентов.
+ZIPF_EXPONENT = 1.1
+# Параметр распределения Парето для числа подписок и избранного на
+# пользователя (среднее у Парето с alpha=1.5 - 3).
+PARETO_ALPHA = 1.5
+PARETO_MEAN = PARETO_ALPHA / (PARETO_ALPHA - 1)
+# Число ингредиентов в рецепте: логнормальное с медианой 8.
+INGREDIENTS_MEDIAN = 8
+INGREDIENTS_SIGMA = 0.35
+MAX_INGREDIENTS = 30
+
+
+class Zipf:
+    """Выбор из набора с вероятностью, обратной степени ранга."""
+
+    def __init__(self, rng, population):
+        self.rng = rng
+        self.population = list(population)
+        rng.shuffle(self.population)
+        self.cum_weights = list(accumulate(
+            1 / (rank + 1) ** ZIPF_EXPONENT
+            for rank in range(len(self.population))
+        ))
+
+    def choice(self):
+        return self.rng.choices(
+            self.population, cum_weights=self.cum_weights
+        )[0]
+
+    def sample(self, count):
+        """До count разных элементов."""
+        count = min(count, len(self.population))
+        chosen = set()
+        # Редкие элементы почти не выпадают, поэтому попыток не больше
+        # нескольких count.
+        for _ in range(count * 4):
+            chosen.update(self.rng.choices(
+                self.population,
+                cum_weights=self.cum_weights,
+                k=count - len(chosen),
+            ))
+            if len(chosen) >= count:
+                break
+        return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует воспроизводимый набор данных для нагрузочного "
+        "тестирования: пользователей, рецепты из реального каталога "
+        "ингредиентов, подписки, избранное и корзины."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--recipes", type=int, default=10000)
+        parser.add_argument(
+            "--follows", type=int, default=20,
+            help="Среднее число подписок пользователя",
+        )
+        parser.add_argument(
+            "--favorites", type=int, default=15,
+            help="Среднее число рецептов в избранном",
+        )
+        parser.add_argument(
+            "--carts", type=int, default=3,
+            help="Среднее число рецептов в корзине",
+        )
+        parser.add_argument(
+            "--images", type=int, default=0,
+            help="Сколько разных картинок-заглушек создать (0 - без картинок)",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--prefix", default="gen",
+            help="Префикс логинов и почты созданных пользователей",
+        )
+        parser.add_argument(
+            "--password", default="password",
+            help="Пароль всех созданных пользователей",
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        prefix = options["prefix"]
+        ingredients = list(Ingredient.objects.values_list("id", flat=True))
+        if not ingredients:
+            raise CommandError(
+                "Каталог ингредиентов пуст - сначала load_ingredients."
+            )
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f"Пользователи с префиксом {prefix!r} уже есть - "
+                f"укажите другой --prefix."
+            )
+        images = self.make_images(options["images"])
+
+        with transaction.atomic():
+            users = self.create_users(
+                options["users"], prefix, options["password"]
+            )
+            recipes = self.create_recipes(
+                options["recipes"], users, ingredients, images
+            )
+            self.create_relations(
+                "Подписки", Follow, "user", "author", users, users,
+                options["follows"], exclude_self=True,
+            )
+            # Лентам нужны актуальные followers_count.
+            call_command("recount_counters", stdout=self.stdout)
+            refresh_authors(
+                User.objects.filter(username__startswith=prefix).values("pk")
+            )
+            self.create_relations(
+                "Избранное", Favorite, "author", "recipe", users, recipes,
+                options["favorites"],
+            )
+            self.create_relations(
+                "Корзины", ShoppingCart, "author", "recipe", users, recipes,
+                options["carts"], uniform=True,
+            )
+            call_command("recount_counters", stdout=self.stdout)
+            call_command("check_shopping_lists", stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS("Набор данных готов!"))
+
+    def make_images(self, count):
+        """Имена в хранилище для count разных картинок-заглушек."""
+        if not count:
+            return []
+        directory = tempfile.mkdtemp(prefix="dataset-images-")
+        paths = []
+        for number in range(count):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            image = Image.new("RGB", (640, 480), color)
+            ImageDraw.Draw(image).text((20, 20), f"#{number}", fill="white")
+            path = os.path.join(directory, f"placeholder_{number}.jpg")
+            image.save(path, "JPEG", quality=80)
+            paths.append(path)
+        progress = Progress(self.stdout, "Картинки", count)
+        names = copy_files(
+            Recipe._meta.get_field("image"), paths, IMAGE_WORKERS
+        )
+        progress.add(count)
+        for path in paths:
+            os.remove(path)
+        os.rmdir(directory)
+        return [names[path] for path in paths]
+
+    def create_users(self, count, prefix, password):
+        # Один хеш на всех: PBKDF2 на каждого пользователя занял бы часы.
+        password = make_password(password)
+        progress = Progress(self.stdout, "Пользователи", count)
+        ids = []
+        for batch in batches(range(count), self.batch_size):
+            users = User.objects.bulk_create(
+                User(
+                    username=f"{prefix}{number}",
+                    email=f"{prefix}{number}@example.com",
+                    first_name=self.rng.choice(("Анна", "Иван", "Мария")),
+                    last_name=f"Тестовый{number}",
+                    password=password,
+                )
+                for number in batch
+            )
+            ids.extend(user.pk for user in users)
+            progress.add(len(batch))
+        return ids
+
+    def ingredient_count(self):
+        count = round(self.rng.lognormvariate(
+            math.log(INGREDIENTS_MEDIAN), INGREDIENTS_SIGMA
+        ))
+        return min(max(count, 1), MAX_INGREDIENTS)
+
+    def recipe_rows(self, count, authors, ingredients, images):
+        for number in range(count):
+            recipe = Recipe(
+                name=f"Рецепт {number}",
+                text=" ".join(self.rng.choices(WORDS, k=20)).capitalize(),
+                cooking_time=self.rng.randint(5, 180),
+                author_id=authors.choice(),
+                image=self.rng.choice(images) if images else "",
+            )
+            self.image_uses[recipe.image.name] += 1
+            amounts = {
+                ingredient_id: self.rng.randint(1, 500)
+                for ingredient_id in ingredients.sample(
+                    self.ingredient_count()
+                )
+            }
+            yield recipe, amounts
+
+    def create_recipes(self, count, users, ingredients, images):
+        progress = Progress(self.stdout, "Рецепты", count)
+        self.image_uses = Counter(dict.fromkeys(images, 0))
+        authors = Zipf(self.rng, users)
+        ingredients = Zipf(self.rng, ingredients)
+        ids = []
+        rows = self.recipe_rows(count, authors, ingredients, images)
+        for batch in batches(rows, self.batch_size):
+            # pub_date у всех - момент вставки, порядок публикации
+            # совпадает с порядком id.
+            create_recipes(batch, self.batch_size)
+            ids.extend(recipe.pk for recipe, _ in batch)
+            progress.add(len(batch))
+        self.add_image_references()
+        return ids
+
+    def add_image_references(self):
+        """copy_files учёл по одной ссылке на картинку, остальные - здесь."""
+        storage = Recipe._meta.get_field("image").storage
+        add_references = getattr(storage, "add_references", None)
+        if add_references is None:
+            return
+        for name, uses in self.image_uses.items():
+            if name and uses != 1:
+                add_references(name, uses - 1)
+
+    def create_relations(self, label, model, owner, target, owners, targets,
+                         mean, exclude_self=False, uniform=False):
+        """
+        Связи пользователь -> автор/рецепт. Число связей на пользователя
+        распределено по Парето (uniform - равномерно), цели выбираются по
+        степенному закону популярности.
+        """
+        popular = Zipf(self.rng, targets)
+        progress = Progress(self.stdout, label)
+
+        def rows():
+            for owner_id in owners:
+                if uniform:
+                    count = self.rng.randint(0, 2 * mean)
+                else:
+                    count = int(
+                        self.rng.paretovariate(PARETO_ALPHA)
+                        * mean / PARETO_MEAN
+                    )
+                for target_id in popular.sample(count):
+                    if exclude_self and target_id == owner_id:
+                        continue
+                    yield model(**{
+                        f"{owner}_id": owner_id, f"{target}_id": target_id
+                    })
+
+        for batch in batches(rows(), self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            progress.add(len(batch))
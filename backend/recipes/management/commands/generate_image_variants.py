@@ -0,0 +1,34 @@
+﻿from django.core.management.base import BaseCommand
+from recipes import images
+from recipes.models import Recipe
+from users.models import User
+
+# Модель: (поле картинки, поле с копиями).
+IMAGE_FIELDS = {
+    Recipe: ("image", "image_variants"),
+    User: ("avatar", "avatar_variants"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Готовит уменьшенные копии картинок рецептов и аватаров, "
+        "для которых их ещё нет."
+    )
+
+    def handle(self, *args, **options):
+        for model, (field_name, variants_field) in IMAGE_FIELDS.items():
+            done = 0
+            queryset = model.objects.exclude(
+                **{f"{field_name}__in": ("", None)}
+            ).only("pk", field_name, variants_field)
+            for instance in queryset.iterator():
+                if images.is_ready(
+                    getattr(instance, field_name),
+                    getattr(instance, variants_field),
+                ):
+                    continue
+                images.process(model, instance.pk, field_name, variants_field)
+                done += 1
+            self.stdout.write(f"{model.__name__}: подготовлено {done}")
+        self.stdout.write(self.style.SUCCESS("Копии картинок готовы!"))
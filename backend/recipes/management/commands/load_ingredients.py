@@ -1,30 +1,121 @@
 ﻿import csv
+import json
 import os
-from django.core.management.base import BaseCommand
+import time
+
 from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.bulk import BATCH_SIZE, batches
 from recipes.models import Ingredient
 
+NAME_LENGTH = Ingredient._meta.get_field("name").max_length
+UNIT_LENGTH = Ingredient._meta.get_field("measurement_unit").max_length
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+        elif row:
+            yield row[0], None
+
+
+def read_json(file):
+    # Весь массив читается json.load: потокового разбора в stdlib нет,
+    # для больших каталогов есть NDJSON.
+    for item in json.load(file):
+        yield item.get("name"), item.get("measurement_unit")
+
+
+def read_ndjson(file):
+    for line in file:
+        if line.strip():
+            item = json.loads(line)
+            yield item.get("name"), item.get("measurement_unit")
+
+
+READERS = {
+    "csv": read_csv,
+    "json": read_json,
+    "ndjson": read_ndjson,
+}
+
 
 class Command(BaseCommand):
+    help = (
+        "Загружает ингредиенты из CSV, JSON или NDJSON пачками. "
+        "Повторная загрузка того же файла ничего не меняет."
+    )
+
     def add_arguments(self, parser):
         parser.add_argument("--path", type=str, help="Путь к файлу")
+        parser.add_argument(
+            "--format",
+            choices=READERS,
+            help="Формат файла, по умолчанию - по расширению",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Строк в одном INSERT",
+        )
+
+    def rows(self, reader, stats):
+        """Очищенные уникальные пары (название, единица)."""
+        seen = set()
+        for line, (name, unit) in enumerate(reader, start=1):
+            stats["read"] += 1
+            name = (name or "").strip()
+            unit = (unit or "").strip()
+            if not name or not unit:
+                stats["invalid"] += 1
+                self.stderr.write(f"Строка {line}: нет названия или единицы")
+                continue
+            if len(name) > NAME_LENGTH or len(unit) > UNIT_LENGTH:
+                stats["invalid"] += 1
+                self.stderr.write(f"Строка {line}: слишком длинное значение")
+                continue
+            key = (name, unit)
+            if key in seen:
+                stats["duplicates"] += 1
+                continue
+            seen.add(key)
+            yield key
 
     def handle(self, *args, **options):
+        if not options["path"]:
+            raise CommandError("Укажите файл: --path data/ingredients.csv")
         file_path = os.path.join(settings.BASE_DIR, options["path"])
-        with open(file_path, "r") as csv_file:
-            reader = csv.reader(csv_file)
-
-            for row in reader:
-                name_csv = 0
-                measurement_unit_csv = 1
-                try:
-                    obj, created = Ingredient.objects.get_or_create(
-                        name=row[name_csv],
-                        measurement_unit=row[measurement_unit_csv],
+        file_format = options["format"] or os.path.splitext(
+            file_path
+        )[1].lstrip(".").lower()
+        if file_format not in READERS:
+            raise CommandError(
+                f"Неизвестный формат {file_format!r}, укажите --format"
+            )
+        stats = dict.fromkeys(("read", "invalid", "duplicates"), 0)
+        started = time.perf_counter()
+        with open(file_path, "r", encoding="utf-8-sig") as file:
+            with transaction.atomic():
+                before = Ingredient.objects.count()
+                for batch in batches(
+                    self.rows(READERS[file_format](file), stats),
+                    options["batch_size"],
+                ):
+                    Ingredient.objects.bulk_create(
+                        [
+                            Ingredient(name=name, measurement_unit=unit)
+                            for name, unit in batch
+                        ],
+                        ignore_conflicts=True,
                     )
-                    if not created:
-                        print(f"Ингредиент {obj} уже есть в базе данных.")
-                except Exception as err:
-                    print(f"Ошибка в строке {row}: {err}")
-
-        print("Данные загружены!")
+                created = Ingredient.objects.count() - before
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f"Прочитано строк: {stats['read']}, добавлено: {created}, "
+            f"повторов в файле: {stats['duplicates']}, "
+            f"с ошибками: {stats['invalid']}. "
+            f"{elapsed:.2f} с, {stats['read'] / elapsed:.0f} строк/с."
+        ))
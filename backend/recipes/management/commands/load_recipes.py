@@ -1,66 +1,148 @@
 ﻿import json
 import os
-from django.core.management.base import BaseCommand
-from recipes.models import Recipe, Ingredient, IngredientRecipe
-from django.contrib.auth import get_user_model
-from django.core.files.images import ImageFile
+from collections import Counter
+
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.bulk import (
+    BATCH_SIZE,
+    IMAGE_WORKERS,
+    Progress,
+    copy_files,
+    create_recipes,
+    refresh_authors,
+)
+from recipes.models import Ingredient, Recipe
 
 User = get_user_model()
 
 
 class Command(BaseCommand):
+    help = (
+        "Загружает рецепты из JSON пачками. Рецепты, которые у автора "
+        "уже есть (по названию), пропускаются."
+    )
 
-    def handle(self, *args, **options):
-        file_path = os.path.join(settings.BASE_DIR, options["path"])
-
-        with open(file_path, "r", encoding="utf-8") as file:
-            recipes = json.load(file)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            type=str,
+            default="data/recipes.json",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Рецептов в одном INSERT",
+        )
+        parser.add_argument(
+            "--image-workers",
+            type=int,
+            default=IMAGE_WORKERS,
+            help="Потоков для копирования картинок",
+        )
 
+    def new_recipes(self, recipes):
+        """Рецепты из файла с найденным автором, которых ещё нет в базе."""
+        authors = dict(User.objects.filter(
+            username__in={recipe["author"] for recipe in recipes}
+        ).values_list("username", "id"))
+        existing = set(Recipe.objects.filter(
+            author_id__in=authors.values()
+        ).values_list("author_id", "name"))
         for recipe_data in recipes:
-            author = User.objects.filter(
-                username=recipe_data["author"]
-            ).first()
-            if not author:
+            author_id = authors.get(recipe_data["author"])
+            if author_id is None:
                 self.stdout.write(
                     self.style.ERROR(
                         f"Автор {recipe_data['author']} не найден."
                     )
                 )
                 continue
+            key = (author_id, recipe_data["name"])
+            if key in existing:
+                self.stdout.write(
+                    f"Рецепт {recipe_data['name']} уже есть у автора "
+                    f"{recipe_data['author']}"
+                )
+                continue
+            existing.add(key)
+            yield author_id, recipe_data
 
-            recipe = Recipe.objects.create(
-                name=recipe_data["name"],
-                text=recipe_data["text"],
-                cooking_time=recipe_data["cooking_time"],
-                author=author,
-            )
+    def ingredient_ids(self, recipes):
+        """Название -> id; при одинаковых названиях - первый ингредиент."""
+        ids = {}
+        for name, pk in Ingredient.objects.filter(
+            name__in={
+                ingredient["name"]
+                for _, recipe_data in recipes
+                for ingredient in recipe_data["ingredients"]
+            }
+        ).order_by("id").values_list("name", "id"):
+            ids.setdefault(name, pk)
+        return ids
 
-            if recipe_data.get("image"):
-                image_path = os.path.join(settings.BASE_DIR, "data", recipe_data["image"])
-                with open(image_path, "rb") as img_file:
-                    recipe.image.save(
-                        os.path.basename(image_path),
-                        ImageFile(img_file),
-                        save=True,
-                    )
+    def amounts(self, recipe_data, ingredient_ids):
+        amounts = Counter()
+        for ingredient in recipe_data["ingredients"]:
+            ingredient_id = ingredient_ids.get(ingredient["name"])
+            if ingredient_id is None:
+                self.stdout.write(
+                    f"Ингредиент {ingredient['name']} не найден "
+                    f"(рецепт {recipe_data['name']})"
+                )
+                continue
+            amounts[ingredient_id] += ingredient["amount"]
+        return amounts
 
-            for ingredient_info in recipe_data["ingredients"]:
-                ingredient = Ingredient.objects.filter(
-                    name=ingredient_info["name"]
-                ).first()
-                if ingredient:
-                    IngredientRecipe.objects.create(
-                        recipe=recipe,
-                        ingredient=ingredient,
-                        amount=ingredient_info["amount"],
-                    )
-            self.stdout.write(
-                self.style.SUCCESS(f"Создан рецепт: {recipe.name}")
+    def handle(self, *args, **options):
+        file_path = os.path.join(settings.BASE_DIR, options["path"])
+
+        with open(file_path, "r", encoding="utf-8") as file:
+            recipes = json.load(file)
+
+        recipes = list(self.new_recipes(recipes))
+        ingredient_ids = self.ingredient_ids(recipes)
+
+        # Файлы копируются до транзакции: потоки пишут в хранилище
+        # своими соединениями и не должны ждать её блокировок.
+        image_paths = {
+            index: os.path.join(
+                settings.BASE_DIR, "data", recipe_data["image"]
             )
-    def add_arguments(self, parser):
-        parser.add_argument(
-            "--path",
-            type=str,
-            default="data/recipes.json",
+            for index, (_, recipe_data) in enumerate(recipes)
+            if recipe_data.get("image")
+        }
+        progress = Progress(self.stdout, "Картинки", len(image_paths))
+        images = copy_files(
+            Recipe._meta.get_field("image"),
+            list(image_paths.values()),
+            options["image_workers"],
         )
+        progress.add(len(image_paths))
+
+        rows = [
+            (
+                Recipe(
+                    name=recipe_data["name"],
+                    text=recipe_data["text"],
+                    cooking_time=recipe_data["cooking_time"],
+                    author_id=author_id,
+                    image=images.get(image_paths.get(index), ""),
+                ),
+                self.amounts(recipe_data, ingredient_ids),
+            )
+            for index, (author_id, recipe_data) in enumerate(recipes)
+        ]
+        progress = Progress(self.stdout, "Рецепты", len(rows))
+        with transaction.atomic():
+            create_recipes(rows, options["batch_size"], progress)
+            refresh_authors({author_id for author_id, _ in recipes})
+        self.stdout.write(self.style.SUCCESS(progress.summary()))
+        if images:
+            self.stdout.write(
+                "Уменьшенные копии картинок: manage.py "
+                "generate_image_variants"
+            )
@@ -1,13 +1,65 @@
 ﻿import json
 import os
-from django.core.management.base import BaseCommand
-from django.contrib.auth import get_user_model
+
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from recipes.bulk import BATCH_SIZE, Progress, batches, hash_passwords
 
 User = get_user_model()
 
 
 class Command(BaseCommand):
+    help = (
+        "Загружает пользователей из JSON пачками. Уже существующие "
+        "(по логину или почте) пропускаются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            type=str,
+            default="data/users.json",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Строк в одном INSERT",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Процессов для хеширования паролей, по умолчанию - по "
+                 "числу ядер",
+        )
+
+    def new_users(self, users):
+        """Записи из файла, которых ещё нет в базе и которые не повторяются."""
+        rows = [
+            (
+                user_data,
+                User.normalize_username(user_data["username"]),
+                User.objects.normalize_email(user_data["email"]),
+            )
+            for user_data in users
+        ]
+        existing = list(User.objects.filter(
+            Q(username__in={username for _, username, _ in rows})
+            | Q(email__in={email for _, _, email in rows})
+        ).values_list("username", "email"))
+        usernames = {username for username, _ in existing}
+        emails = {email for _, email in existing}
+        for user_data, username, email in rows:
+            if username in usernames or email in emails:
+                self.stdout.write(f"Пользователь {username} уже существует")
+                continue
+            usernames.add(username)
+            emails.add(email)
+            yield user_data, username, email
 
     def handle(self, *args, **options):
         file_path = os.path.join(settings.BASE_DIR, options["path"])
@@ -15,28 +67,27 @@ class Command(BaseCommand):
         with open(file_path, "r", encoding="utf-8") as file:
             users = json.load(file)
 
-        for user_data in users:
-            if not User.objects.filter(
-                username=user_data["username"]
-            ).exists():
-                user = User.objects.create_user(
-                    username=user_data["username"],
-                    email=user_data["email"],
-                    first_name=user_data["first_name"],
-                    last_name=user_data["last_name"],
-                    password=user_data["password"],
-                )
-                self.stdout.write(
-                    self.style.SUCCESS(f"Создан пользователь: {user.username}")
-                )
-            else:
-                self.stdout.write(
-                    f'Пользователь {user_data["username"]} уже существует'
-                )
-
-    def add_arguments(self, parser):
-        parser.add_argument(
-            "--path",
-            type=str,
-            default="data/recipes.json",
+        rows = list(self.new_users(users))
+        progress = Progress(self.stdout, "Пароли", len(rows))
+        passwords = hash_passwords(
+            (user_data["password"] for user_data, _, _ in rows),
+            options["workers"],
         )
+        progress.add(len(passwords))
+
+        progress = Progress(self.stdout, "Пользователи", len(rows))
+        with transaction.atomic():
+            for batch in batches(zip(rows, passwords), options["batch_size"]):
+                User.objects.bulk_create(
+                    User(
+                        username=username,
+                        email=email,
+                        first_name=user_data["first_name"],
+                        last_name=user_data["last_name"],
+                        is_staff=user_data.get("is_staff", False),
+                        password=password,
+                    )
+                    for (user_data, username, email), password in batch
+                )
+                progress.add(len(batch))
+        self.stdout.write(self.style.SUCCESS(progress.summary()))
@@ -0,0 +1,22 @@
+﻿from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes import timeline
+from recipes.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает ленты подписок: нужно после смены порога популярных "
+        "авторов или длины ленты."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            TimelineEntry.objects.all().delete()
+            timeline.push_authors(
+                Follow.objects.values("author_id").distinct()
+            )
+            total = TimelineEntry.objects.count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Ленты подписок пересобраны: {total} записей."
+        ))
@@ -0,0 +1,16 @@
+﻿from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.counters import COUNTERS, recount
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает денормализованные счётчики рецептов и авторов."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for source, (model, fk_field, counter) in COUNTERS.items():
+                drifted = recount(source)
+                self.stdout.write(
+                    f"{model.__name__}.{counter}: исправлено {drifted}"
+                )
+        self.stdout.write(self.style.SUCCESS("Счётчики пересчитаны!"))
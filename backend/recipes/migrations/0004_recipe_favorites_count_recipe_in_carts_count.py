@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:23
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'User')
+    for model, source, fk_field, counter in (
+        (Recipe, 'Favorite', 'recipe_id', 'favorites_count'),
+        (Recipe, 'ShoppingCart', 'recipe_id', 'in_carts_count'),
+        (User, 'Recipe', 'author_id', 'recipes_count'),
+        (User, 'Follow', 'author_id', 'followers_count'),
+    ):
+        rows = apps.get_model('recipes', source).objects.filter(
+            **{fk_field: OuterRef('pk')}
+        ).order_by().values(fk_field).annotate(total=Count('pk'))
+        model.objects.update(
+            **{counter: Coalesce(Subquery(rows.values('total')), 0)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_ingredient_updated_at_recipe_updated_at'),
+        ('users', '0003_user_followers_count_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном (раз)'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок (раз)'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Путь в хранилище')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер, байт')),
+                ('refcount', models.IntegerField(default=0, verbose_name='Ссылок')),
+                ('updated_at', models.DateTimeField(verbose_name='Последнее сохранение')),
+            ],
+            options={
+                'verbose_name': 'Файл хранилища',
+                'verbose_name_plural': 'Файлы хранилища',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_mediablob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShortLinkClicks',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('clicks', models.PositiveIntegerField(default=0, verbose_name='Переходов')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='link_clicks', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Переходы по короткой ссылке',
+                'verbose_name_plural': 'Переходы по коротким ссылкам',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('recipe', 'date'), name='unique_link_clicks')],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:48
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Сливает одинаковые ингредиенты в запись с наименьшим id: ссылки
+    переносятся на неё, количества в одном рецепте/списке складываются.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in groups:
+        keep = group['keep']
+        duplicates = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(pk=keep).values_list('pk', flat=True))
+        for model, owner, amount in (
+            (IngredientRecipe, 'recipe_id', 'amount'),
+            (ShoppingListItem, 'user_id', 'total_amount'),
+        ):
+            for row in model.objects.filter(ingredient_id__in=duplicates):
+                kept = model.objects.filter(
+                    ingredient_id=keep, **{owner: getattr(row, owner)}
+                ).first()
+                if kept is None:
+                    row.ingredient_id = keep
+                    row.save(update_fields=['ingredient'])
+                    continue
+                setattr(
+                    kept, amount, getattr(kept, amount) + getattr(row, amount)
+                )
+                kept.save(update_fields=[amount])
+                row.delete()
+        Ingredient.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    # Слияние и ограничение - в разных транзакциях: PostgreSQL не даёт
+    # менять таблицу (ALTER TABLE) с отложенными триггерами внешних
+    # ключей после правки связанных строк.
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0009_shortlinkclicks'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicates, migrations.RunPython.noop, atomic=True
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
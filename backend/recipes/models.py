@@ -1,7 +1,7 @@
 ﻿from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db.models import Q, F
-from users.models import User
+from users.models import CounterFieldsMixin, User
 import secrets
 
 MIN_AMOUNT = 1
@@ -23,17 +23,25 @@ class Ingredient(models.Model):
         max_length=200,
         help_text="Введите единицу измерения",
     )
+    updated_at = models.DateTimeField(
+        verbose_name="Дата изменения", auto_now=True, db_index=True
+    )
 
     class Meta:
         ordering = ["id"]
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name", "measurement_unit"], name="unique_ingredient"
+            )
+        ]
 
     def __str__(self):
         return f"{self.name}"
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     """
     Рецепты.
     У автора не может быть создано более одного рецепта с одним именем.
@@ -75,6 +83,10 @@ class Recipe(models.Model):
         help_text="Добавьте изображение рецепта",
         default=None,
     )
+    image_variants = models.JSONField(
+        verbose_name="Уменьшенные копии картинки", default=dict,
+        blank=True, editable=False,
+    )
 
     author = models.ForeignKey(
         User,
@@ -87,6 +99,19 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         verbose_name="Дата публикации", auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name="Дата изменения", auto_now=True
+    )
+
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном (раз)", default=0, editable=False
+    )
+
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name="В списках покупок (раз)", default=0, editable=False
+    )
+
+    COUNTER_FIELDS = ("favorites_count", "in_carts_count")
 
     class Meta:
         ordering = ["-pub_date"]
@@ -181,6 +206,112 @@ class ShoppingCart(models.Model):
         return f"{self.recipe}"
 
 
+class ShoppingListItem(models.Model):
+    """
+    Итог по ингредиенту в списке покупок пользователя.
+    Поддерживается при изменении корзины и состава рецептов.
+    """
+
+    user = models.ForeignKey(
+        User,
+        related_name="shopping_list",
+        on_delete=models.CASCADE,
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name="Ингредиент",
+    )
+    total_amount = models.PositiveIntegerField(verbose_name="Количество")
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "Итог списка покупок"
+        verbose_name_plural = "Итоги списков покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"], name="unique_shopping_list_item"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.ingredient} {self.total_amount}"
+
+
+class TimelineEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя (fan-out-on-write).
+    Автор и дата публикации скопированы из рецепта, чтобы обрезать
+    ленту и убирать рецепты автора при отписке без JOIN.
+    """
+
+    user = models.ForeignKey(
+        User,
+        related_name="timeline",
+        on_delete=models.CASCADE,
+        verbose_name="Пользователь",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name="timeline_entries",
+        on_delete=models.CASCADE,
+        verbose_name="Рецепт",
+    )
+    author = models.ForeignKey(
+        User,
+        related_name="+",
+        on_delete=models.CASCADE,
+        verbose_name="Автор рецепта",
+    )
+    pub_date = models.DateTimeField(verbose_name="Дата публикации")
+
+    class Meta:
+        ordering = ["-pub_date", "-id"]
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Лента подписок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"], name="unique_timeline_entry"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-id"],
+                name="timeline_user_pub_date",
+            ),
+            models.Index(
+                fields=["user", "author"], name="timeline_user_author"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe}"
+
+
+class MediaBlob(models.Model):
+    """
+    Файл в хранилище с адресацией по содержимому.
+    refcount - сколько раз файл сохраняли минус сколько удаляли;
+    команда gc_media пересчитывает его по реальным ссылкам.
+    """
+
+    name = models.CharField(
+        verbose_name="Путь в хранилище", max_length=255, unique=True
+    )
+    size = models.PositiveBigIntegerField(verbose_name="Размер, байт")
+    refcount = models.IntegerField(verbose_name="Ссылок", default=0)
+    updated_at = models.DateTimeField(verbose_name="Последнее сохранение")
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "Файл хранилища"
+        verbose_name_plural = "Файлы хранилища"
+
+    def __str__(self):
+        return self.name
+
+
 class Favorite(models.Model):
     """
     Избранные рецепты пользователя.
@@ -255,6 +386,12 @@ def generate_short_code():
     return secrets.token_urlsafe(8)[:8]
 
 class ShortLink(models.Model):
+    """
+    Случайные коды, выданные до перехода на коды из id рецепта
+    (recipes/shortcodes.py). Новые записи не создаются, старые ссылки
+    продолжают работать.
+    """
+
     short_code = models.CharField(
         max_length=20, 
         primary_key=True, 
@@ -270,4 +407,33 @@ class ShortLink(models.Model):
 
     class Meta:
         verbose_name = 'Short Link'
-        verbose_name_plural = 'Short Links'
\ No newline at end of file
+        verbose_name_plural = 'Short Links'
+
+
+class ShortLinkClicks(models.Model):
+    """
+    Переходы по короткой ссылке рецепта за день.
+    Пишутся пачками из буфера в памяти (api/clicks.py).
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name="link_clicks",
+        on_delete=models.CASCADE,
+        verbose_name="Рецепт",
+    )
+    date = models.DateField(verbose_name="Дата")
+    clicks = models.PositiveIntegerField(verbose_name="Переходов", default=0)
+
+    class Meta:
+        ordering = ["-date"]
+        verbose_name = "Переходы по короткой ссылке"
+        verbose_name_plural = "Переходы по коротким ссылкам"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipe", "date"], name="unique_link_clicks"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} {self.date}: {self.clicks}"
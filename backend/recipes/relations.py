@@ -0,0 +1,65 @@
+﻿"""
+Связи текущего пользователя на время запроса: на кого он подписан,
+что у него в избранном и в корзине.
+
+Все три множества id читаются одним UNION ALL запросом при первом
+обращении и дальше отвечают на is_subscribed, is_favorited и
+is_in_shopping_cart любого сериализатора без обращения к БД.
+"""
+from django.db.models import IntegerField, Value
+from .models import Favorite, Follow, ShoppingCart
+
+ATTR_NAME = "_user_relations"
+FOLLOWED, FAVORITES, CART = range(3)
+
+
+class UserRelations:
+
+    def __init__(self, user):
+        self.user = user
+        self._sets = None
+
+    def _load(self):
+        sets = {FOLLOWED: set(), FAVORITES: set(), CART: set()}
+        if self.user is not None and self.user.is_authenticated:
+            rows = self._tagged(Follow, "user", "author_id", FOLLOWED).union(
+                self._tagged(Favorite, "author", "recipe_id", FAVORITES),
+                self._tagged(ShoppingCart, "author", "recipe_id", CART),
+                all=True,
+            )
+            for kind, pk in rows:
+                sets[kind].add(pk)
+        return sets
+
+    def _tagged(self, model, user_field, id_field, kind):
+        return model.objects.filter(**{user_field: self.user}).annotate(
+            kind=Value(kind, output_field=IntegerField())
+        ).order_by().values_list("kind", id_field)
+
+    def _get(self, kind):
+        if self._sets is None:
+            self._sets = self._load()
+        return self._sets[kind]
+
+    @property
+    def followed(self):
+        return self._get(FOLLOWED)
+
+    @property
+    def favorites(self):
+        return self._get(FAVORITES)
+
+    @property
+    def cart(self):
+        return self._get(CART)
+
+
+def for_request(request):
+    """Загрузчик связей, общий для всех сериализаторов одного запроса."""
+    if request is None:
+        return UserRelations(None)
+    relations = getattr(request, ATTR_NAME, None)
+    if relations is None or relations.user is not request.user:
+        relations = UserRelations(request.user)
+        setattr(request, ATTR_NAME, relations)
+    return relations
@@ -0,0 +1,117 @@
+﻿"""
+Материализованные итоги списков покупок (ShoppingListItem).
+
+Итоги меняются на разницу в количествах ингредиентов при добавлении
+рецепта в корзину, удалении из неё и изменении состава рецепта.
+Команда check_shopping_lists пересобирает таблицу с нуля.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+from users.models import User
+from .models import IngredientRecipe, ShoppingCart, ShoppingListItem
+
+
+def recipe_amounts(recipe_id):
+    """Количества ингредиентов рецепта: {ingredient_id: amount}."""
+    return dict(
+        IngredientRecipe.objects.filter(recipe_id=recipe_id).values_list(
+            "ingredient_id", "amount"
+        )
+    )
+
+
+def change_user_list(user_id, deltas):
+    """Применяет изменения к списку покупок одного пользователя."""
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if deltas:
+        with transaction.atomic():
+            # Блокировка пользователя сериализует правки его списка.
+            list(User.objects.select_for_update().filter(pk=user_id))
+            _change_user_list(user_id, deltas)
+
+
+def _change_user_list(user_id, deltas):
+    items = {
+        item.ingredient_id: item
+        for item in ShoppingListItem.objects.filter(
+            user_id=user_id, ingredient_id__in=deltas
+        )
+    }
+    to_update, to_create, to_delete = [], [], []
+    for ingredient_id, delta in deltas.items():
+        item = items.get(ingredient_id)
+        if item is None:
+            if delta > 0:
+                to_create.append(ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=delta,
+                ))
+        elif item.total_amount + delta > 0:
+            item.total_amount += delta
+            to_update.append(item)
+        else:
+            to_delete.append(item.pk)
+    ShoppingListItem.objects.bulk_create(to_create)
+    ShoppingListItem.objects.bulk_update(to_update, ["total_amount"])
+    ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+
+
+def add_recipe(user_id, recipe_id):
+    change_user_list(user_id, recipe_amounts(recipe_id))
+
+
+def remove_recipe(user_id, recipe_id):
+    change_user_list(user_id, {
+        ingredient_id: -amount
+        for ingredient_id, amount in recipe_amounts(recipe_id).items()
+    })
+
+
+def recipe_changed(recipe_id, old_amounts):
+    """
+    Переносит изменение состава рецепта в списки всех пользователей,
+    у которых он в корзине: один UPDATE (и INSERT) на ингредиент.
+    """
+    deltas = Counter(recipe_amounts(recipe_id))
+    deltas.subtract(old_amounts)
+    users = ShoppingCart.objects.filter(recipe_id=recipe_id).values("author")
+    for ingredient_id, delta in deltas.items():
+        if not delta:
+            continue
+        items = ShoppingListItem.objects.filter(
+            user__in=users, ingredient_id=ingredient_id
+        )
+        items.update(total_amount=Greatest(F("total_amount") + delta, 0))
+        if delta > 0:
+            ShoppingListItem.objects.bulk_create(
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=delta,
+                )
+                for user_id in ShoppingCart.objects.filter(
+                    recipe_id=recipe_id
+                ).exclude(
+                    author__shopping_list__ingredient_id=ingredient_id
+                ).values_list("author_id", flat=True)
+            )
+    ShoppingListItem.objects.filter(
+        user__in=users, total_amount=0
+    ).delete()
+
+
+def expected_totals():
+    """Итоги, посчитанные заново из корзин: {(user_id, ingredient_id): sum}."""
+    return {
+        (row["recipe__shopping_cart__author"], row["ingredient"]):
+        row["total"]
+        for row in IngredientRecipe.objects.filter(
+            recipe__shopping_cart__isnull=False
+        ).values(
+            "recipe__shopping_cart__author", "ingredient"
+        ).annotate(total=Sum("amount")).order_by().iterator()
+    }
@@ -0,0 +1,53 @@
+﻿from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from users.models import User
+from . import images, shopping_list, timeline
+from .counters import change_counter
+from .models import Favorite, Follow, Recipe, ShoppingCart
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Follow)
+def increment_counter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counter(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Follow)
+def decrement_counter(sender, instance, **kwargs):
+    change_counter(instance, -1)
+
+
+@receiver(post_delete, sender=Follow)
+def refill_demoted_author(sender, instance, **kwargs):
+    # После decrement_counter: followers_count уже уменьшен.
+    timeline.demoted(instance.author_id)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        shopping_list.add_recipe(instance.author_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    # pre_delete: при каскадном удалении рецепта его ингредиенты ещё на месте.
+    shopping_list.remove_recipe(instance.author_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def make_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.schedule(instance, "image", "image_variants")
+
+
+@receiver(post_save, sender=User)
+def make_avatar_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.schedule(instance, "avatar", "avatar_variants")
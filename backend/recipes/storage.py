@@ -0,0 +1,119 @@
+﻿"""
+Хранилище медиафайлов с адресацией по содержимому.
+
+Имя файла - SHA-256 содержимого внутри каталога upload_to поля:
+recipes/images/ab/abcd...ef.png. Повторная загрузка той же картинки
+стоит одного хеширования: файл уже лежит на диске и не пишется заново.
+Каталоги и URL остаются прежними, поэтому ImageField и alias /media/ в
+nginx работают без изменений.
+
+Число ссылок на файл хранится в MediaBlob: save() его увеличивает,
+delete() уменьшает, но файл не удаляет - им может пользоваться другая
+запись. Файлы без ссылок удаляет команда gc_media.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from django.utils import timezone
+
+CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # Одинаковое имя означает одинаковое содержимое - суффиксы
+        # для уникальности не нужны.
+        return name
+
+    def _blob_name(self, name, content):
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        digest = content_hash(content)
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def _save(self, name, content):
+        name = self._blob_name(name, content)
+        # Сначала ссылка, потом проверка файла: свежая ссылка не даёт
+        # gc_media удалить файл между проверкой и сохранением записи.
+        self._add_reference(name, content.size)
+        if not self.exists(name):
+            self._write(name, content)
+        return name
+
+    def _write(self, name, content):
+        """
+        Пишет во временный файл и атомарно переименовывает: параллельная
+        загрузка того же файла просто перезапишет его тем же содержимым.
+        """
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    tmp_file.write(chunk)
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _add_reference(self, name, size):
+        from .db import insert_ignore
+        from .models import MediaBlob
+
+        now = timezone.now()
+        blobs = MediaBlob.objects.filter(name=name)
+        if blobs.update(refcount=F("refcount") + 1, updated_at=now):
+            return
+        if insert_ignore(
+            MediaBlob, name=name, size=size, refcount=1, updated_at=now
+        ) is None:
+            blobs.update(refcount=F("refcount") + 1, updated_at=now)
+
+    def add_references(self, name, count=1):
+        """
+        Ещё count ссылок на уже сохранённый файл: массовая загрузка
+        сохраняет общую картинку один раз на все записи.
+        """
+        from .models import MediaBlob
+
+        MediaBlob.objects.filter(name=name).update(
+            refcount=F("refcount") + count, updated_at=timezone.now()
+        )
+
+    def delete(self, name):
+        """
+        Снимает ссылку на файл. Файлы, сохранённые до перехода на это
+        хранилище, в MediaBlob не учтены и удаляются сразу, как раньше.
+        """
+        from .models import MediaBlob
+
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        if not MediaBlob.objects.filter(name=name).update(
+            refcount=F("refcount") - 1
+        ):
+            super().delete(name)
+
+    def delete_blob(self, name):
+        """Удаляет сам файл - только для сборщика мусора."""
+        super().delete(name)
@@ -0,0 +1,203 @@
+﻿"""
+Лента подписок (fan-out-on-write).
+
+Новый рецепт сразу раскладывается по лентам подписчиков автора, при
+подписке лента дополняется последними рецептами автора, при отписке они
+из неё убираются. Длина ленты ограничена TIMELINE_MAX_LENGTH.
+
+Рецепты авторов, у которых не меньше TIMELINE_CELEBRITY_FOLLOWERS
+подписчиков, по лентам не раскладываются: их читают при запросе ленты
+(fan-out-on-read). Когда автор опускается ниже порога, его рецепты
+раскладываются по лентам оставшихся подписчиков (demoted). Команда
+rebuild_timelines пересобирает таблицу с нуля.
+"""
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from users.models import User
+from .models import Follow, Recipe, TimelineEntry
+
+BATCH_SIZE = 1000
+
+
+def is_celebrity(author):
+    return author.followers_count >= settings.TIMELINE_CELEBRITY_FOLLOWERS
+
+
+def _supports_window():
+    connection = connections[router.db_for_write(TimelineEntry)]
+    return connection.features.supports_over_clause
+
+
+def trim(user_ids):
+    """Удаляет из лент пользователей записи сверх TIMELINE_MAX_LENGTH."""
+    limit = settings.TIMELINE_MAX_LENGTH
+    if not _supports_window():
+        for user_id in user_ids:
+            overflow = list(
+                TimelineEntry.objects.filter(user_id=user_id).order_by(
+                    "-pub_date", "-id"
+                ).values_list("pk", flat=True)[limit:]
+            )
+            if overflow:
+                TimelineEntry.objects.filter(pk__in=overflow).delete()
+        return
+    overflow = TimelineEntry.objects.filter(user_id__in=user_ids).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=F("user_id"),
+            order_by=(F("pub_date").desc(), F("id").desc()),
+        )
+    ).filter(position__gt=limit).values("pk")
+    TimelineEntry.objects.filter(pk__in=overflow).delete()
+
+
+def push_recipe(recipe):
+    """Кладёт новый рецепт в ленты подписчиков автора."""
+    # Счётчик читается из БД: recipe.author - часто пользователь из кэша
+    # токенов, и его followers_count может быть устаревшим.
+    if User.objects.filter(
+        pk=recipe.author_id,
+        followers_count__gte=settings.TIMELINE_CELEBRITY_FOLLOWERS,
+    ).exists():
+        return
+    followers = list(
+        Follow.objects.filter(author_id=recipe.author_id).values_list(
+            "user_id", flat=True
+        )
+    )
+    if not followers:
+        return
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                recipe=recipe,
+                author_id=recipe.author_id,
+                pub_date=recipe.pub_date,
+            )
+            for user_id in followers
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim(followers)
+
+
+def backfill(user, author):
+    """Добавляет в ленту последние рецепты автора после подписки."""
+    if is_celebrity(author):
+        return
+    recipes = author.recipes.order_by("-pub_date", "-id").values_list(
+        "id", "pub_date"
+    )[:settings.TIMELINE_MAX_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user.pk,
+                recipe_id=recipe_id,
+                author_id=author.pk,
+                pub_date=pub_date,
+            )
+            for recipe_id, pub_date in recipes
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim([user.pk])
+
+
+def push_authors(author_ids):
+    """
+    Раскладывает последние рецепты авторов по лентам всех их подписчиков:
+    массовый backfill для загрузки данных и пересборки лент. По два
+    запроса на автора вместо нескольких на каждую подписку.
+    """
+    followers = {}
+    for user_id, author_id in Follow.objects.filter(
+        author_id__in=author_ids,
+        author__followers_count__lt=settings.TIMELINE_CELEBRITY_FOLLOWERS,
+    ).values_list("user_id", "author_id").iterator():
+        followers.setdefault(author_id, []).append(user_id)
+    touched = set()
+    for author_id, user_ids in followers.items():
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            "-pub_date", "-id"
+        ).values_list("id", "pub_date")[:settings.TIMELINE_MAX_LENGTH]
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for recipe_id, pub_date in recipes
+                for user_id in user_ids
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        touched.update(user_ids)
+    touched = sorted(touched)
+    for start in range(0, len(touched), BATCH_SIZE):
+        trim(touched[start:start + BATCH_SIZE])
+
+
+def demoted(author_id):
+    """
+    Вызывается после уменьшения числа подписчиков автора. Если автор
+    только что опустился ниже TIMELINE_CELEBRITY_FOLLOWERS, его рецепты
+    больше не читаются при запросе ленты - они раскладываются по лентам
+    подписчиков, которым при подписке не попали.
+    """
+    if User.objects.filter(
+        pk=author_id,
+        followers_count=settings.TIMELINE_CELEBRITY_FOLLOWERS - 1,
+    ).exists():
+        push_authors([author_id])
+
+
+def remove(user, author_id):
+    """Убирает рецепты автора из ленты после отписки."""
+    TimelineEntry.objects.filter(user=user, author_id=author_id).delete()
+
+
+def feed_recipe_ids(user, limit, position=None, ascending=False):
+    """
+    id рецептов, из которых собирается страница ленты (порядок по id
+    рецепта, как у курсорной пагинации). Берутся до limit записей ленты
+    пользователя за позицией курсора - по индексу (user, recipe) без
+    сортировки всей ленты - и до limit рецептов популярных авторов, на
+    которых он подписан. Страница - первые limit рецептов объединения,
+    поэтому больше limit из каждого источника не нужно.
+    """
+    lookup = "gt" if ascending else "lt"
+    order = "" if ascending else "-"
+    entries = TimelineEntry.objects.filter(user=user)
+    if position is not None:
+        entries = entries.filter(**{f"recipe_id__{lookup}": position})
+    ids = list(
+        entries.order_by(f"{order}recipe_id").values_list(
+            "recipe_id", flat=True
+        )[:limit]
+    )
+    celebrities = list(
+        Follow.objects.filter(
+            user=user,
+            author__followers_count__gte=(
+                settings.TIMELINE_CELEBRITY_FOLLOWERS
+            ),
+        ).values_list("author_id", flat=True)
+    )
+    if celebrities:
+        recipes = Recipe.objects.filter(author_id__in=celebrities)
+        if position is not None:
+            recipes = recipes.filter(**{f"pk__{lookup}": position})
+        ids.extend(
+            recipes.order_by(f"{order}pk").values_list(
+                "pk", flat=True
+            )[:limit]
+        )
+    return ids
@@ -15,6 +15,8 @@ class UserAdmin(admin.ModelAdmin):
         "email",
         "role",
         "admin",
+        "recipes_count",
+        "followers_count",
     )
     search_fields = ("username", "email")
     list_filter = (
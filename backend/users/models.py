@@ -3,7 +3,34 @@ from django.core.validators import  RegexValidator
 from django.contrib.auth.models import AbstractUser
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """
+    Обычный save() не пишет денормализованные счётчики COUNTER_FIELDS:
+    их меняют только UPDATE с F-выражением (recipes/counters.py), и копия
+    в памяти, прочитанная раньше, затёрла бы чужие изменения. Счётчик
+    сохраняется, только если он явно указан в update_fields.
+    """
+
+    COUNTER_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and not kwargs.get("force_insert")
+            and kwargs.get("update_fields") is None
+        ):
+            # Как и save() без update_fields, отложенные поля не пишутся.
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     """
     Класс пользователя.
     """
@@ -29,6 +56,20 @@ class User(AbstractUser):
         blank=True, null=True,
         verbose_name='Аватар',
     )
+    avatar_variants = models.JSONField(
+        verbose_name="Уменьшенные копии аватара", default=dict,
+        blank=True, editable=False,
+    )
+    updated_at = models.DateTimeField(
+        verbose_name="Дата изменения", auto_now=True
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name="Рецептов", default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name="Подписчиков", default=0, editable=False
+    )
+    COUNTER_FIELDS = ("recipes_count", "followers_count")
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
 
@@ -1,10 +1,13 @@
 ﻿from rest_framework import serializers
-from drf_extra_fields.fields import Base64ImageField
 from django.core.validators import RegexValidator
+from api.fields import LimitedBase64ImageField
+from api.timing import TimedListSerializer, TimedSerializerMixin
+from recipes import images
+from recipes.relations import for_request
 from .models import User
 
 
-class UserCreateSerializer(serializers.ModelSerializer):
+class UserCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Сериализатор для создания пользователя с гарантированным форматом ответа
     """
@@ -50,14 +53,16 @@ class UserCreateSerializer(serializers.ModelSerializer):
         return data
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer для чтения / создания пользователя модели User.
     """
     is_subscribed = serializers.SerializerMethodField()
+    avatar_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = User
+        list_serializer_class = TimedListSerializer
         fields = (
             "id",
             "email",
@@ -66,20 +71,25 @@ class UserSerializer(serializers.ModelSerializer):
             "last_name",
             "is_subscribed",
             "avatar",
+            "avatar_variants",
         )
         read_only_fields = fields
 
     def get_is_subscribed(self, obj):
-        request = self.context['request']
-        if not request.user.is_authenticated:
-            return False
-        return request.user.follower.filter(author=obj).exists()
+        relations = for_request(self.context.get('request'))
+        return obj.pk in relations.followed
+
+    def get_avatar_variants(self, obj):
+        return images.absolute_urls(
+            self.context.get('request'),
+            images.variant_urls(obj.avatar, obj.avatar_variants),
+        )
 
 
 class UserAvatarSerializer(UserSerializer):
     """Сериализатор для аватара пользователя."""
 
-    avatar = Base64ImageField()
+    avatar = LimitedBase64ImageField()
 
     class Meta:
         model = User
@@ -4,14 +4,21 @@ from rest_framework.decorators import action
 from djoser.serializers import SetPasswordSerializer
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Count, Max
+from api.mixins import ConditionalGetMixin
 from api.paginations import ApiPagination
 from api.permissions import IsCurrentUserOrAdminOrReadOnly
+from api.prefetch import prefetch_latest_recipes, recipes_limit
 from api.serializers import FollowSerializer
+from recipes import timeline
+from recipes.db import delete_returning, insert_ignore
+from recipes.models import Follow
 from .models import User
 from .serializers import UserCreateSerializer, UserSerializer, UserAvatarSerializer
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Viewset для пользователя / подписок."""
 
     queryset = User.objects.all()
@@ -19,6 +26,16 @@ class UserViewSet(viewsets.ModelViewSet):
     pagination_class = ApiPagination
     serializer_class = UserSerializer
 
+    def get_list_version(self):
+        return User.objects.aggregate(
+            count=Count("id"), updated_at=Max("updated_at")
+        )
+
+    def get_object_version(self):
+        return User.objects.filter(pk=self.get_lookup_pk()).values(
+            "updated_at"
+        ).first()
+
     def get_serializer_class(self):
         if self.action == 'create':
             return UserCreateSerializer
@@ -91,33 +108,43 @@ class UserViewSet(viewsets.ModelViewSet):
         methods=["post", "delete"],
         permission_classes=[IsAuthenticated],
     )
+    @transaction.atomic
     def subscribe(self, request, *args, **kwargs):
-        """Создание и удаление подписки."""
-        author = get_object_or_404(User, id=kwargs.get("pk"))
+        """
+        Создание и удаление подписки.
+        Запись - один INSERT ... ON CONFLICT DO NOTHING или
+        DELETE ... RETURNING, поэтому повторные запросы не дают 500.
+        """
         user = request.user
+        pk = self.get_lookup_pk()
 
         if request.method == "POST":
-            if user.follower.filter(author=author).exists():
+            author = get_object_or_404(User, id=pk)
+            if user == author:
+                return Response(
+                    {"errors": "Нельзя подписаться на себя!"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            follow = insert_ignore(Follow, user=user, author=author)
+            if follow is None:
                 return Response(
                     {"errors": "Вы уже подписаны на этого автора"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
+            timeline.backfill(user, author)
             serializer = FollowSerializer(
-                data=request.data,
-                context={"request": request, "author": author},
+                follow, context={"request": request}
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save(author=author, user=user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        subscription = user.follower.filter(author=author).first()
-        if not subscription:
-            return Response(
-                {"errors": "Вы не подписаны на этого автора"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        subscription.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        if delete_returning(Follow, user=user, author_id=pk):
+            timeline.remove(user, pk)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, id=pk)
+        return Response(
+            {"errors": "Вы не подписаны на этого автора"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
     @action(
         detail=False, 
@@ -125,9 +152,16 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def subscriptions(self, request):
-        """Отображение всех подписок пользователя."""
-        follows = request.user.follower.all()
+        """
+        Отображение всех подписок пользователя.
+        Число запросов не зависит от размера страницы: авторы читаются
+        вместе с подписками, их последние рецепты - одним запросом.
+        """
+        follows = request.user.follower.select_related("author")
         pages = self.paginate_queryset(follows)
+        prefetch_latest_recipes(
+            (follow.author for follow in pages), recipes_limit(request)
+        )
         serializer = FollowSerializer(
             pages, 
             many=True, 